@@ -1,94 +1,197 @@
 import os
+import io
 import glob
+import time
+import logging
+import argparse
+import functools
+import itertools
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import psycopg2
 import pandas as pd
 from sql_queries import *
+from manifest import record_files, select_new_files
+from metrics import METRICS, timed_chunks
+from song_lookup import DURATION_TOLERANCE, SNAPSHOT_PATH, build_index_from_db, \
+    build_index_from_files, files_signature, load_or_build_index, resolve_songs
+from time_dimension import build_time_table
+import json_lines
+from json_lines import read_log_chunks, read_log_file, read_song_chunks, read_song_file, rechunk
 
 
-def process_song_file(cur, filepath):
+DSN = "host=127.0.0.1 dbname=sparkifydb user=student password=student"
+
+# number of files read and loaded in one transaction by the bulk mode
+BULK_BATCH_SIZE = 500
+
+# seconds between two progress reports of the parallel mode
+PROGRESS_INTERVAL = 5
+
+
+def process_song_file(cur, filepath, chunk_rows = None, max_chunk_bytes = None):
     """
     Process the song data file and insert the data into artists and songs tables. 
 
     Args:
         cur: psycopg2 cursor created from the connection with the DB;
-        filepath: root directory where the other directories with the song data files are.
+        filepath: root directory where the other directories with the song data files are;
+        chunk_rows, max_chunk_bytes: limits of the chunks read from the file, see json_lines.py.
     """
     # open song file
-    df = pd.read_json(filepath, lines = True)
+    with METRICS.timer("parse"):
+        df = read_song_file(filepath, chunk_rows, max_chunk_bytes)
 
     # insert artist record
     artist_data = df[["artist_id", "artist_name", "artist_location", "artist_latitude", "artist_longitude"]].values[0].tolist()
-    cur.execute(artist_table_insert, artist_data)
+    with METRICS.timer("load", "artists"):
+        cur.execute(artist_table_insert, artist_data)
+    METRICS.count("artists", rows = 1, round_trips = 1)
 
     # insert song record
     song_data = df[["song_id", "title", "artist_id", "year", "duration"]].values[0].tolist()
-    cur.execute(song_table_insert, song_data)
+    with METRICS.timer("load", "songs"):
+        cur.execute(song_table_insert, song_data)
+    METRICS.count("songs", rows = 1, round_trips = 1)
     
 
 
-def process_log_file(cur, filepath):
+def process_log_file(cur, filepath, song_index = None, tolerance = DURATION_TOLERANCE, time_cache = None,
+                     chunk_rows = None, max_chunk_bytes = None):
     """
     Preprocess the log data in 3 steps and insert the data into time, users and songplays tables.
     The steps are:
-    1. Extract the ts data, transform it into datetime format and extract "hour", 
+    1. Extract the ts data not loaded yet, transform it into datetime format and extract "hour", 
     "day", "week", "month", "year", "weekday" features for time table;
     2. Extact the "stat_time", "hour", "day", "week", "month", "year", "weekday" features for users table;
-    3. Use the song, artist and length data to get artist_id and song_id by querying it from the DB and 
-    insert it with the other elements of data into songplays table.
+    3. Use the song, artist and length data to get artist_id and song_id by querying it from the DB 
+    (or from the song lookup index, when one is given) and insert it with the other elements 
+    of data into songplays table.
 
     Args:
         cur: psycopg2 cursor created from the connection with the DB;
-        filepath: root directory where the other directories with the log data files are.
+        filepath: root directory where the other directories with the log data files are;
+        song_index: lookup index from song_lookup.py, None to query each song in the DB;
+        tolerance: maximum difference between the event length and the song duration for the index;
+        time_cache: set with the timestamps already loaded, see build_time_table();
+        chunk_rows, max_chunk_bytes: limits of the chunks read from the file, see json_lines.py.
     """
 
-    # open log file
-    df = pd.read_json(filepath, lines = True)
+    # open log file and go through its NextSong events in chunks of bounded size
+    for df in timed_chunks(read_log_chunks(filepath, chunk_rows, max_chunk_bytes)):
 
-    # filter by NextSong action
-    df = df[df.page == "NextSong"]
+        with METRICS.timer("transform"):
+            # filter by NextSong action
+            df = df[df.page == "NextSong"]
 
-    # convert timestamp column to timestamp
-    t = pd.to_datetime(df.ts, unit = 'ms',) 
-    
-    # insert time data records
-    time_data = zip(t, t.dt.hour, t.dt.day, t.dt.week, t.dt.month, t.dt.year, t.dt.weekday)
-    column_labels = ["stat_time", "hour", "day", "week", "month", "year", "weekday"]
-    time_df = pd.DataFrame(time_data, columns = column_labels)
+            # build the time records of the timestamps not loaded yet
+            time_df = build_time_table(df.ts, time_cache)
 
-    for i, row in time_df.iterrows():
-        cur.execute(time_table_insert, list(row))
+            # load user table
+            user_df = df[["userId","firstName", "lastName", "gender", "level"]]
 
-    # load user table
-    user_df = df[["userId","firstName", "lastName", "gender", "level"]]
+            # get song_id and artist_id of all events at once from the lookup index
+            if song_index is not None:
+                df = resolve_songs(df, song_index, tolerance)
+
+        # insert time data records
+        with METRICS.timer("load", "time"):
+            for i, row in time_df.iterrows():
+                cur.execute(time_table_insert, list(row))
+        METRICS.count("time", rows = len(time_df), round_trips = len(time_df))
+
+        # insert user records
+        with METRICS.timer("load", "users"):
+            for i, row in user_df.iterrows():
+                cur.execute(user_table_insert, row)
+        METRICS.count("users", rows = len(user_df), round_trips = len(user_df))
+
+        # insert songplay records, numbered after the ones already stored as in the other modes
+        with METRICS.timer("load", "songplays"):
+            cur.execute(songplay_max_id)
+            first_id = cur.fetchone()[0] + 1
+            for songplay_id, (index, row) in enumerate(df.iterrows(), first_id):
+            
+                # get song_id and artist_id from song and artist tables
+                if song_index is not None:
+                    songid, artistid = row.song_id, row.artist_id
+                else:
+                    cur.execute(song_select, (row.song, row.artist, row.length))
+                    results = cur.fetchone()
+                
+                    if results:
+                        songid, artistid = results
+                    else:
+                        songid, artistid = None, None
+
+                # insert songplay record
+                songplay_data = (songplay_id, pd.to_datetime(row.ts, unit = 'ms'), row.userId, 
+                                row.level, songid, artistid, 
+                                row.sessionId, row.location, row.userAgent)
+                cur.execute(songplay_table_insert, songplay_data)
+
+        # one more round trip per songplay when its song is queried in the DB, and one for the first id
+        METRICS.count("songplays", rows = len(df),
+                      round_trips = 1 + len(df) * (1 if song_index is not None else 2))
+
+
+def get_files(filepath):
+    """
+    Walk the parsed filepath and collect the absolute paths of all json files found.
+
+    Args:
+        filepath: root directory where the other directories with the data files are.
+
+    Returns:
+        all_files: sorted list with the absolute path of each json file.
+    """
+    all_files = []
+    for root, dirs, files in os.walk(filepath):
+        files = glob.glob(os.path.join(root,'*.json'))
+        for f in files :
+            all_files.append(os.path.abspath(f))
+
+    return sorted(all_files)
+
+
+def get_new_files(cur, conn, filepath):
+    """
+    Collect the json files under the parsed filepath that are not in the manifest 
+    table yet or changed since they were loaded.
+
+    Args:
+        cur: psycopg2 cursor created from the connection with the DB;
+        conn: connection with the DB established through psycopg2;
+        filepath: root directory where the other directories with the data files are.
+
+    Returns:
+        new_files: sorted list with the absolute path of each file to process;
+        records: dict with the manifest record of each one of them.
+    """
+    with METRICS.timer("discovery"):
+        all_files = get_files(filepath)
+        new_files, records = select_new_files(cur, all_files)
+        conn.commit()
 
-    # insert user records
-    for i, row in user_df.iterrows():
-        cur.execute(user_table_insert, row)
-
-    # insert songplay records
-    for index, row in df.iterrows():
-        
-        # get song_id and artist_id from song and artist tables
-        cur.execute(song_select, (row.song, row.artist, row.length))
-        results = cur.fetchone()
-        
-        if results:
-            songid, artistid = results
-        else:
-            songid, artistid = None, None
-
-        # insert songplay record
-        songplay_data = (index, pd.to_datetime(row.ts, unit = 'ms'), row.userId, 
-                        row.level, songid, artistid, 
-                        row.sessionId, row.location, row.userAgent)
-        cur.execute(songplay_table_insert, songplay_data)
+    print('{} files found in {}, {} of them new or changed.'.format(len(all_files), filepath, len(new_files)))
+
+    return new_files, records
+
+
+def save_manifest(cur, records):
+    """Store the manifest records of the files loaded, one round trip per record."""
+    with METRICS.timer("load", "etl_manifest"):
+        record_files(cur, records)
+    METRICS.count("etl_manifest", rows = len(records), round_trips = len(records))
 
 
 def process_data(cur, conn, filepath, func):
     """
-    Extract all paths of the files stored in the parsed filepath, 
-    apply the parsed function to each datafile commiting the operation 
-    at the end of each step.  
+    Extract all paths of the new or changed files stored in the parsed filepath, 
+    apply the parsed function to each datafile commiting the operation together 
+    with its manifest record at the end of each step.  
 
     Args:
         cur: psycopg2 cursor created from the connection with the DB;
@@ -98,34 +201,601 @@ def process_data(cur, conn, filepath, func):
 
     """
 
-    # get all files matching extension from directory
-    all_files = []
-    for root, dirs, files in os.walk(filepath):
-        files = glob.glob(os.path.join(root,'*.json'))
-        for f in files :
-            all_files.append(os.path.abspath(f))
+    # get all new files matching extension from directory
+    all_files, records = get_new_files(cur, conn, filepath)
 
     # get total number of files found
     num_files = len(all_files)
-    print('{} files found in {}'.format(num_files, filepath))
 
     # iterate over files and process
     for i, datafile in enumerate(all_files, 1):
         func(cur, datafile)
+        save_manifest(cur, [records[datafile]])
         conn.commit()
         print('{}/{} files processed.'.format(i, num_files))
 
 
+def copy_to_staging(cur, df, table):
+    """
+    Stream the rows of a DataFrame into a staging table with COPY FROM STDIN,
+    using an in-memory csv buffer instead of one INSERT per row.
+
+    Args:
+        cur: psycopg2 cursor created from the connection with the DB;
+        df: DataFrame whose columns have the same names as the staging table columns;
+        table: name of the staging table.
+    """
+    buffer = io.StringIO()
+    df.to_csv(buffer, index = False, header = False, na_rep = '\\N')
+    buffer.seek(0)
+    cur.copy_expert(staging_copy.format(table, ", ".join(df.columns)), buffer)
+
+
+def create_staging_tables(cur, conn):
+    """
+    Create the temporary staging tables used by the bulk mode. They belong to the 
+    connection, so it has to be done once for every new connection.
+
+    Args:
+        cur: psycopg2 cursor created from the connection with the DB;
+        conn: connection with the DB established through psycopg2.
+    """
+    for query in create_staging_queries:
+        cur.execute(query)
+    conn.commit()
+
+
+def transform_song_data(df):
+    """
+    Extract the artist and song records of one or more song data files.
+
+    Args:
+        df: DataFrame with the content of the song data files.
+
+    Returns:
+        artist_df: artist records numbered by the ordinal column, so the last one of each artist wins;
+        song_df: song records.
+    """
+    artist_df = df[["artist_id", "artist_name", "artist_location", "artist_latitude", "artist_longitude"]]
+    artist_df.columns = ["artist_id", "name", "location", "latitude", "longitude"]
+    artist_df = artist_df.rename_axis("ordinal").reset_index()
+
+    song_df = df[["song_id", "title", "artist_id", "year", "duration"]]
+
+    return artist_df, song_df
+
+
+def transform_log_data(df, song_index = None, tolerance = DURATION_TOLERANCE, time_cache = None):
+    """
+    Filter the NextSong events of one or more log data files and extract the time,
+    user and songplay records. The songplays are not numbered yet, and have their 
+    song_id and artist_id only when a song lookup index is given.
+
+    Args:
+        df: DataFrame with the content of the log data files;
+        song_index: lookup index from song_lookup.py, None to match the songs later in the DB;
+        tolerance: maximum difference between the event length and the song duration for the index;
+        time_cache: set with the timestamps already loaded, see build_time_table().
+
+    Returns:
+        time_df: time records of the timestamps not loaded yet;
+        user_df: user records numbered by the ordinal column, so the last one of each user wins;
+        songplay_df: songplay records without songplay_id.
+    """
+    # filter by NextSong action
+    df = df[df.page == "NextSong"].reset_index(drop = True)
+    df["userId"] = df.userId.astype(int)
+
+    # convert timestamp column to timestamp
+    t = pd.to_datetime(df.ts, unit = 'ms')
+
+    time_df = build_time_table(df.ts, time_cache)
+
+    user_df = df[["userId","firstName", "lastName", "gender", "level"]]
+    user_df.columns = ["user_id", "first_name", "last_name", "gender", "level"]
+    user_df = user_df.rename_axis("ordinal").reset_index()
+
+    songplay_df = pd.DataFrame({"start_time": t, "user_id": df.userId, "level": df.level, 
+                                "song": df.song, "artist": df.artist, "length": df.length, 
+                                "session_id": df.sessionId, "location": df.location, 
+                                "user_agent": df.userAgent})
+    if song_index is not None:
+        songplay_df = resolve_songs(songplay_df, song_index, tolerance)
+
+    return time_df, user_df, songplay_df
+
+
+def load_table(cur, df, table, staging_table, merge_query):
+    """
+    Stage the records of a table and merge them into it, measuring the time spent,
+    the rows sent and the round trips (one COPY, one merge and one TRUNCATE statement).
+    The staging table is emptied after the merge, so the next chunk of the same 
+    transaction does not merge these rows again and its last record of each key wins.
+    """
+    with METRICS.timer("load", table):
+        copy_to_staging(cur, df, staging_table)
+        cur.execute(merge_query)
+        cur.execute(staging_truncate.format(staging_table))
+    METRICS.count(table, rows = len(df), round_trips = 3)
+
+
+def load_artists(cur, artist_df):
+    """Stage the artist records and merge them into the artists table."""
+    load_table(cur, artist_df, "artists", "artists_staging", artist_table_merge)
+
+
+def load_songs(cur, song_df):
+    """Stage the song records and merge them into the songs table."""
+    load_table(cur, song_df, "songs", "songs_staging", song_table_merge)
+
+
+def load_time(cur, time_df):
+    """Stage the time records and merge them into the time table."""
+    load_table(cur, time_df, "time", "time_staging", time_table_merge)
+
+
+def load_users(cur, user_df):
+    """Stage the user records and merge them into the users table."""
+    load_table(cur, user_df, "users", "users_staging", user_table_merge)
+
+
+def load_songplays(cur, songplay_df):
+    """
+    Stage the numbered songplay records and merge them into the songplays table,
+    joining them with the songs and artists tables when they were not resolved 
+    with the song lookup index.
+    """
+    if "song_id" in songplay_df.columns:
+        load_table(cur, songplay_df, "songplays", "songplays_staging", songplay_table_merge_resolved)
+    else:
+        load_table(cur, songplay_df, "songplays", "songplays_staging", songplay_table_merge)
+
+
+def bulk_load_song_data(cur, df):
+    """
+    Copy a batch of song data into the staging tables and merge it into the 
+    artists and songs tables with one set-based statement per table.
+
+    Args:
+        cur: psycopg2 cursor created from the connection with the DB;
+        df: DataFrame with the content of one or more song data files.
+    """
+    with METRICS.timer("transform"):
+        artist_df, song_df = transform_song_data(df)
+
+    # artists first as songs reference them
+    load_artists(cur, artist_df)
+    load_songs(cur, song_df)
+
+
+def bulk_load_log_data(cur, df, song_index = None, tolerance = DURATION_TOLERANCE, time_cache = None):
+    """
+    Copy a batch of log data into the staging tables and merge it into the 
+    time, users and songplays tables with one set-based statement per table.
+    The song_id and artist_id of each songplay come from the song lookup index or,
+    without one, are matched inside the DB by joining the staged rows with the 
+    songs and artists tables.
+
+    Args:
+        cur: psycopg2 cursor created from the connection with the DB;
+        df: DataFrame with the content of one or more log data files;
+        song_index: lookup index from song_lookup.py, None to match the songs in the DB;
+        tolerance: maximum difference between the event length and the song duration for the index;
+        time_cache: set with the timestamps already loaded, see build_time_table().
+    """
+    with METRICS.timer("transform"):
+        time_df, user_df, songplay_df = transform_log_data(df, song_index, tolerance, time_cache)
+
+    load_time(cur, time_df)
+    load_users(cur, user_df)
+
+    # number the songplays after the ones already stored
+    with METRICS.timer("load", "songplays"):
+        cur.execute(songplay_max_id)
+        first_id = cur.fetchone()[0] + 1
+    METRICS.count("songplays", round_trips = 1)
+    songplay_df.insert(0, "songplay_id", range(first_id, first_id + len(songplay_df)))
+
+    load_songplays(cur, songplay_df)
+
+
+def process_data_bulk(cur, conn, filepath, func, read_chunks, batch_size = BULK_BATCH_SIZE, chunk_rows = None):
+    """
+    Extract all paths of the new or changed files stored in the parsed filepath, 
+    read them in batches of batch_size files and apply the parsed bulk function to 
+    each batch, commiting the operation and the manifest records once per batch.
+    The files are streamed in chunks of at most chunk_rows rows, so the 
+    memory used does not grow with the size of the files or of the batch.
+
+    Args:
+        cur: psycopg2 cursor created from the connection with the DB;
+        conn: connection with the DB established through psycopg2;
+        filepath: root directory where the other directories with the data files are;
+        func: one of the two bulk functions created above - bulk_load_song_data() or bulk_load_log_data();
+        read_chunks: read_song_chunks() or read_log_chunks() from json_lines.py;
+        batch_size: number of files loaded in each transaction;
+        chunk_rows: number of rows the small chunks are joined into, json_lines.CHUNK_ROWS by default.
+    """
+
+    # get all new files matching extension from directory
+    all_files, records = get_new_files(cur, conn, filepath)
+
+    # get total number of files found
+    num_files = len(all_files)
+
+    # iterate over batches of files and process
+    for start in range(0, num_files, batch_size):
+        batch = all_files[start:start + batch_size]
+        for df in timed_chunks(rechunk(itertools.chain.from_iterable(read_chunks(datafile) for datafile in batch),
+                                            chunk_rows)):
+            func(cur, df)
+        save_manifest(cur, [records[datafile] for datafile in batch])
+        conn.commit()
+        print('{}/{} files processed.'.format(start + len(batch), num_files))
+
+
+def parse_song_file(filepath, chunk_rows = None, max_chunk_bytes = None):
+    """
+    Read one song data file and extract its records. Runs in the worker processes 
+    of the parallel mode.
+
+    Args:
+        filepath: path of the song data file;
+        chunk_rows, max_chunk_bytes: limits of the chunks read from the file, see json_lines.py.
+
+    Returns:
+        frames: tuple (artist_df, song_df) from transform_song_data().
+    """
+    with METRICS.timer("parse"):
+        df = read_song_file(filepath, chunk_rows, max_chunk_bytes)
+    with METRICS.timer("transform"):
+        return transform_song_data(df)
+
+
+# song lookup index, tolerance and time cache of each worker process, set once by init_log_parser()
+_parser_song_index = None
+_parser_tolerance = DURATION_TOLERANCE
+_parser_time_cache = None
+
+
+def init_log_parser(song_index, tolerance):
+    """
+    Keep the song lookup index in the worker process so it is not sent with every file,
+    and start its own cache of loaded timestamps (the unique start_time of the time 
+    table settles the ones repeated between workers).
+    """
+    global _parser_song_index, _parser_tolerance, _parser_time_cache
+    _parser_song_index, _parser_tolerance, _parser_time_cache = song_index, tolerance, set()
+
+
+def parse_log_file(filepath, chunk_rows = None, max_chunk_bytes = None):
+    """
+    Read one log data file and extract its records. Runs in the worker processes 
+    of the parallel mode.
+
+    Args:
+        filepath: path of the log data file;
+        chunk_rows, max_chunk_bytes: limits of the chunks read from the file, see json_lines.py.
+
+    Returns:
+        frames: tuple (time_df, user_df, songplay_df) from transform_log_data().
+    """
+    with METRICS.timer("parse"):
+        df = read_log_file(filepath, chunk_rows, max_chunk_bytes)
+    with METRICS.timer("transform"):
+        return transform_log_data(df, _parser_song_index, _parser_tolerance, _parser_time_cache)
+
+
+def measure_parse(parse_func, filepath):
+    """
+    Run parse_func in a worker process and return its frames together with the 
+    snapshot of the parse and transform time it took, to be merged by the coordinator.
+    """
+    METRICS.reset()
+    frames = parse_func(filepath)
+
+    return frames, METRICS.snapshot()
+
+
+def load_song_dimensions(cur, frames):
+    """Merge the artists of one song file on the coordinator connection, returning what is left to load."""
+    artist_df, song_df = frames
+    load_artists(cur, artist_df)
+
+    return (song_df,)
+
+
+def load_song_facts(cur, frames):
+    """Merge the songs of one song file on a loader connection."""
+    song_df, = frames
+    load_songs(cur, song_df)
+
+
+def load_log_dimensions(cur, frames, songplay_ids):
+    """
+    Merge the users of one log file on the coordinator connection and number its
+    songplays with the next ids of songplay_ids, returning what is left to load.
+    """
+    time_df, user_df, songplay_df = frames
+    load_users(cur, user_df)
+    songplay_df.insert(0, "songplay_id", list(itertools.islice(songplay_ids, len(songplay_df))))
+
+    return time_df, songplay_df
+
+
+def load_log_facts(cur, frames):
+    """Merge the time records and songplays of one log file on a loader connection."""
+    time_df, songplay_df = frames
+    load_time(cur, time_df)
+    load_songplays(cur, songplay_df)
+
+
+def process_data_parallel(cur, conn, filepath, parse_func, dimensions_func, facts_func, 
+                          workers, initializer = None, initargs = ()):
+    """
+    Extract all paths of the new or changed files stored in the parsed filepath and 
+    process them with a pool of workers in 3 overlapping steps:
+    1. worker processes read and transform the files (parse_func), at most 2 files per 
+    worker ahead of this process;
+    2. this process takes the results back in file order and merges the dimension 
+    records on its own connection (dimensions_func), so the last record of each 
+    key wins exactly as in the other modes and foreign keys are already committed;
+    3. loader threads, each one with its own connection, merge the remaining 
+    records (facts_func) together with the manifest record of the file while 
+    the next files are being parsed.
+
+    Progress and throughput are printed every PROGRESS_INTERVAL seconds, and the
+    parse and transform time measured in the workers is added to METRICS.
+
+    Args:
+        cur: psycopg2 cursor created from the connection with the DB;
+        conn: connection with the DB established through psycopg2;
+        filepath: root directory where the other directories with the data files are;
+        parse_func: parse_song_file() or parse_log_file();
+        dimensions_func: function(cur, frames) returning the frames left for facts_func;
+        facts_func: function(cur, frames) loading them;
+        workers: number of worker processes and of loader threads;
+        initializer, initargs: run once in each worker process.
+    """
+
+    # get all new files matching extension from directory
+    all_files, records = get_new_files(cur, conn, filepath)
+
+    # get total number of files found
+    num_files = len(all_files)
+
+    # each loader thread opens its own connection on its first task
+    local = threading.local()
+    loader_connections = []
+    lock = threading.Lock()
+
+    def load_facts(frames, record):
+        if not hasattr(local, "conn"):
+            local.conn = psycopg2.connect(DSN)
+            local.cur = local.conn.cursor()
+            create_staging_tables(local.cur, local.conn)
+            with lock:
+                loader_connections.append(local.conn)
+        facts_func(local.cur, frames)
+        save_manifest(local.cur, [record])
+        local.conn.commit()
+
+    start = last_report = time.perf_counter()
+    num_rows = 0
+    pending = deque()
+
+    try:
+        with multiprocessing.Pool(workers, initializer, initargs) as pool, \
+                ThreadPoolExecutor(workers) as loaders:
+            # the results are taken back in file order, so the songplay_ids do not depend on the 
+            # timing of the workers, and a file is only sent once an older one is taken back, 
+            # so at most 2 parsed files per worker wait in memory
+            parse = functools.partial(measure_parse, parse_func)
+            files = iter(all_files)
+            parsing = deque((datafile, pool.apply_async(parse, (datafile,)))
+                            for datafile in itertools.islice(files, 2 * workers))
+            i = 0
+            while parsing:
+                datafile, result = parsing.popleft()
+                frames, snapshot = result.get()
+                i += 1
+                for next_file in itertools.islice(files, 1):
+                    parsing.append((next_file, pool.apply_async(parse, (next_file,))))
+
+                METRICS.merge(snapshot)
+                num_rows += sum(len(df) for df in frames)
+                frames = dimensions_func(cur, frames)
+                conn.commit()
+
+                # bound the number of parsed files waiting for a loader
+                pending.append(loaders.submit(load_facts, frames, records[datafile]))
+                while len(pending) > 2 * workers:
+                    pending.popleft().result()
+
+                now = time.perf_counter()
+                if now - last_report >= PROGRESS_INTERVAL or i == num_files:
+                    last_report = now
+                    print('{}/{} files parsed, {:.1f} files/s, {:.0f} rows/s.'.format(
+                        i, num_files, i / (now - start), num_rows / (now - start)))
+
+            while pending:
+                pending.popleft().result()
+    finally:
+        for loader_conn in loader_connections:
+            loader_conn.close()
+
+    elapsed = time.perf_counter() - start
+    print('{} files and {} rows loaded in {:.2f}s, {:.1f} files/s, {:.0f} rows/s.'.format(
+        num_files, num_rows, elapsed, num_files / max(elapsed, 1e-9), num_rows / max(elapsed, 1e-9)))
+
+
+def get_song_index(cur, args):
+    """
+    Load the song lookup index from its snapshot or build it from the source chosen
+    in the command line arguments.
+
+    Args:
+        cur: psycopg2 cursor created from the connection with the DB;
+        args: parsed command line arguments of main().
+
+    Returns:
+        song_index: DataFrame from song_lookup.py, or None when --song-index is none.
+    """
+    if args.song_index == 'none':
+        return None
+
+    if args.song_index == 'files':
+        song_files = get_files(os.path.join(args.data_dir, 'song_data'))
+        build = lambda: build_index_from_files(song_files)
+        signature = ('files', files_signature(song_files))
+    else:
+        cur.execute(song_index_signature)
+        build = lambda: build_index_from_db(cur)
+        signature = ('db',) + tuple(cur.fetchone())
+
+    song_index = load_or_build_index(build, signature, args.song_index_snapshot, args.rebuild_index)
+    print('{} songs in the lookup index.'.format(len(song_index)))
+
+    return song_index
+
+
+def load_song_data(cur, conn, filepath, args):
+    """
+    Load the song data files with the mode chosen in the command line arguments.
+
+    Args:
+        cur: psycopg2 cursor created from the connection with the DB;
+        conn: connection with the DB established through psycopg2;
+        filepath: root directory where the other directories with the song data files are;
+        args: parsed command line arguments of main().
+    """
+    limits = dict(chunk_rows = args.chunk_rows, max_chunk_bytes = args.max_chunk_bytes)
+    if args.mode == 'parallel':
+        process_data_parallel(cur, conn, filepath, functools.partial(parse_song_file, **limits), 
+                              load_song_dimensions, load_song_facts, args.workers)
+    elif args.mode == 'bulk':
+        process_data_bulk(cur, conn, filepath, bulk_load_song_data, functools.partial(read_song_chunks, **limits),
+                          args.batch_size, args.chunk_rows)
+    else:
+        process_data(cur, conn, filepath=filepath, func=functools.partial(process_song_file, **limits))
+
+
+def load_log_data(cur, conn, filepath, args):
+    """
+    Load the log data files with the mode chosen in the command line arguments,
+    matching their songs with the song lookup index unless --song-index is none.
+
+    Args:
+        cur: psycopg2 cursor created from the connection with the DB;
+        conn: connection with the DB established through psycopg2;
+        filepath: root directory where the other directories with the log data files are;
+        args: parsed command line arguments of main().
+    """
+    song_index = get_song_index(cur, args)
+    limits = dict(chunk_rows = args.chunk_rows, max_chunk_bytes = args.max_chunk_bytes)
+    if args.mode == 'parallel':
+        cur.execute(songplay_max_id)
+        songplay_ids = itertools.count(cur.fetchone()[0] + 1)
+        process_data_parallel(cur, conn, filepath, functools.partial(parse_log_file, **limits), 
+                              functools.partial(load_log_dimensions, songplay_ids = songplay_ids), 
+                              load_log_facts, args.workers, 
+                              init_log_parser, (song_index, args.duration_tolerance))
+    elif args.mode == 'bulk':
+        load_func = functools.partial(bulk_load_log_data, song_index = song_index, 
+                                      tolerance = args.duration_tolerance, time_cache = set())
+        process_data_bulk(cur, conn, filepath, load_func, functools.partial(read_log_chunks, **limits),
+                          args.batch_size, args.chunk_rows)
+    else:
+        load_func = functools.partial(process_log_file, song_index = song_index, 
+                                      tolerance = args.duration_tolerance, time_cache = set(), **limits)
+        process_data(cur, conn, filepath=filepath, func=load_func)
+
+
 def main():
     """
     Establish the connection, create a cursor and process the data calling first the process_data 
     function with process_song_file and them with process_log_file as input.
+
+    With --mode bulk the files are loaded in batches through staging tables instead, calling
+    process_data_bulk with bulk_load_song_data and then with bulk_load_log_data. The time 
+    spent on each dataset is printed so both modes can be compared.
+
+    With --mode parallel the files are parsed by a pool of --workers processes and
+    loaded by as many connections through process_data_parallel.
+
+    The files are read in chunks of at most --chunk-rows rows and --max-chunk-bytes
+    bytes, keeping only the columns and events needed.
+
+    Only the files that are not in the manifest table yet, or changed since they were 
+    loaded, are processed. --full-refresh empties the manifest and songplays tables
+    first, so every file is loaded again.
+
+    Unless --song-index none is given, the songs of the log events are matched with an 
+    in-memory lookup index built from the song files or from the DB, which is kept as a 
+    snapshot on disk for the next runs.
+
+    The data is read from the song_data and log_data folders of --data-dir, and --datasets
+    allows loading only one of them (e.g. to time each one separately).
+
+    The time spent in file discovery, parsing, transforming and loading each table, with
+    the rows and DB round trips of each table, is logged as json at the end of each dataset
+    (totals of the run so far) and, with --metrics-textfile, written in the Prometheus 
+    text format.
     """
-    conn = psycopg2.connect("host=127.0.0.1 dbname=sparkifydb user=student password=student")
+    parser = argparse.ArgumentParser(description = 'Load the song and log data into sparkifydb.')
+    parser.add_argument('--mode', choices = ['row', 'bulk', 'parallel'], default = 'row',
+                        help = 'insert row by row, COPY batches through staging tables '
+                               'or COPY each file with a pool of workers')
+    parser.add_argument('--batch-size', type = int, default = BULK_BATCH_SIZE,
+                        help = 'number of files per transaction in bulk mode')
+    parser.add_argument('--workers', type = int, default = os.cpu_count(),
+                        help = 'number of worker processes and connections in parallel mode')
+    parser.add_argument('--song-index', choices = ['files', 'db', 'none'], default = 'files',
+                        help = 'source of the song lookup index, none to query each song in the DB')
+    parser.add_argument('--song-index-snapshot', default = SNAPSHOT_PATH,
+                        help = 'file where the song lookup index is kept between runs')
+    parser.add_argument('--rebuild-index', action = 'store_true',
+                        help = 'ignore the snapshot and build the song lookup index again')
+    parser.add_argument('--duration-tolerance', type = float, default = DURATION_TOLERANCE,
+                        help = 'maximum difference between the event length and the song duration')
+    parser.add_argument('--full-refresh', action = 'store_true',
+                        help = 'ignore the manifest and load every file again')
+    parser.add_argument('--chunk-rows', type = int, default = json_lines.CHUNK_ROWS,
+                        help = 'maximum number of rows read from the files at a time')
+    parser.add_argument('--max-chunk-bytes', type = int, default = json_lines.MAX_CHUNK_BYTES,
+                        help = 'maximum number of json bytes buffered at a time')
+    parser.add_argument('--data-dir', default = 'data',
+                        help = 'folder with the song_data and log_data folders')
+    parser.add_argument('--datasets', nargs = '+', choices = ['song_data', 'log_data'], 
+                        default = ['song_data', 'log_data'], help = 'datasets to load')
+    parser.add_argument('--metrics-textfile',
+                        help = 'file where the metrics are written for the Prometheus node exporter')
+    args = parser.parse_args()
+
+    logging.basicConfig(level = logging.INFO, format = '%(asctime)s %(levelname)s %(name)s %(message)s')
+
+    conn = psycopg2.connect(DSN)
     cur = conn.cursor()
 
-    process_data(cur, conn, filepath='data/song_data', func=process_song_file)
-    process_data(cur, conn, filepath='data/log_data', func=process_log_file)
+    cur.execute(manifest_table_create)
+    if args.full_refresh:
+        for query in full_refresh_queries:
+            cur.execute(query)
+    conn.commit()
+
+    start = time.perf_counter()
+    if args.mode != 'row':
+        create_staging_tables(cur, conn)
+    if 'song_data' in args.datasets:
+        load_song_data(cur, conn, os.path.join(args.data_dir, 'song_data'), args)
+        METRICS.log(dataset = 'song_data', mode = args.mode)
+    if 'log_data' in args.datasets:
+        load_log_data(cur, conn, os.path.join(args.data_dir, 'log_data'), args)
+        METRICS.log(dataset = 'log_data', mode = args.mode)
+    print('Data loaded in {:.2f}s ({} mode).'.format(time.perf_counter() - start, args.mode))
+
+    if args.metrics_textfile:
+        METRICS.write_textfile(args.metrics_textfile)
 
     conn.close()
 
@@ -0,0 +1,129 @@
+import json
+import pandas as pd
+
+
+# columns of the log data used by the time, users and songplays tables
+LOG_COLUMNS = ["artist", "firstName", "gender", "lastName", "length", "level", "location",
+               "page", "sessionId", "song", "ts", "userAgent", "userId"]
+
+# columns of the song data used by the songs and artists tables
+SONG_COLUMNS = ["artist_id", "artist_name", "artist_location", "artist_latitude",
+                "artist_longitude", "song_id", "title", "duration", "year"]
+
+# maximum number of rows of each DataFrame yielded by read_json_lines()
+CHUNK_ROWS = 50000
+
+# maximum number of bytes of json buffered for each DataFrame yielded by read_json_lines()
+MAX_CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def is_next_song(record):
+    """Keep only the events of songs being played."""
+    return record.get("page") == "NextSong"
+
+
+def read_json_lines(filepath, columns, predicate = None, contains = None,
+                    chunk_rows = None, max_chunk_bytes = None):
+    """
+    Read a json lines file in chunks, decoding one line at a time and keeping only
+    the records accepted by the predicate and the parsed columns, so the memory
+    used does not depend on the size of the file.
+
+    Args:
+        filepath: path of the json lines file;
+        columns: list with the keys kept from each record, missing keys become None;
+        predicate: function(record) returning True for the records to keep, None to keep all;
+        contains: text that must be in a line for it to be decoded at all (e.g. '"NextSong"'),
+        a cheap filter applied before json.loads();
+        chunk_rows: maximum number of rows per chunk, CHUNK_ROWS by default;
+        max_chunk_bytes: maximum number of json bytes buffered per chunk, MAX_CHUNK_BYTES
+        by default. A single line bigger than this raises ValueError.
+
+    Yields:
+        df: DataFrame with the parsed columns and at most chunk_rows rows.
+    """
+    chunk_rows = chunk_rows or CHUNK_ROWS
+    max_chunk_bytes = max_chunk_bytes or MAX_CHUNK_BYTES
+
+    rows, chunk_bytes = [], 0
+    with open(filepath, encoding = "utf8") as f:
+        for line in f:
+            if contains is not None and contains not in line:
+                continue
+
+            line_bytes = len(line.encode("utf8"))
+            if line_bytes > max_chunk_bytes:
+                raise ValueError("line of {} bytes in {} is bigger than the chunk limit of {} bytes"
+                                 .format(line_bytes, filepath, max_chunk_bytes))
+            if not line.strip():
+                continue
+
+            record = json.loads(line)
+            if predicate is not None and not predicate(record):
+                continue
+
+            if len(rows) >= chunk_rows or chunk_bytes + line_bytes > max_chunk_bytes:
+                yield pd.DataFrame(rows, columns = columns)
+                rows, chunk_bytes = [], 0
+
+            rows.append([record.get(column) for column in columns])
+            chunk_bytes += line_bytes
+
+    if rows:
+        yield pd.DataFrame(rows, columns = columns)
+
+
+def read_log_chunks(filepath, chunk_rows = None, max_chunk_bytes = None):
+    """Read the NextSong events of a log data file in chunks with the LOG_COLUMNS."""
+    return read_json_lines(filepath, LOG_COLUMNS, predicate = is_next_song, contains = '"NextSong"',
+                           chunk_rows = chunk_rows, max_chunk_bytes = max_chunk_bytes)
+
+
+def read_song_chunks(filepath, chunk_rows = None, max_chunk_bytes = None):
+    """Read the records of a song data file in chunks with the SONG_COLUMNS."""
+    return read_json_lines(filepath, SONG_COLUMNS, chunk_rows = chunk_rows, max_chunk_bytes = max_chunk_bytes)
+
+
+def rechunk(chunks, chunk_rows = None):
+    """
+    Join consecutive small chunks, as the ones of many one-record song files,
+    into DataFrames of about chunk_rows rows.
+
+    Args:
+        chunks: iterable of DataFrames with the same columns;
+        chunk_rows: minimum number of rows per joined chunk, CHUNK_ROWS by default.
+
+    Yields:
+        df: DataFrame with one or more of the chunks.
+    """
+    chunk_rows = chunk_rows or CHUNK_ROWS
+
+    pending, pending_rows = [], 0
+    for df in chunks:
+        pending.append(df)
+        pending_rows += len(df)
+        if pending_rows >= chunk_rows:
+            yield pd.concat(pending, ignore_index = True)
+            pending, pending_rows = [], 0
+
+    if pending:
+        yield pd.concat(pending, ignore_index = True)
+
+
+def concat_chunks(chunks, columns):
+    """Join all the chunks of a file, returning an empty DataFrame with the columns when there are none."""
+    chunks = list(chunks)
+    if not chunks:
+        return pd.DataFrame(columns = columns)
+
+    return pd.concat(chunks, ignore_index = True)
+
+
+def read_log_file(filepath, chunk_rows = None, max_chunk_bytes = None):
+    """Read all the NextSong events of a log data file as a single DataFrame."""
+    return concat_chunks(read_log_chunks(filepath, chunk_rows, max_chunk_bytes), LOG_COLUMNS)
+
+
+def read_song_file(filepath, chunk_rows = None, max_chunk_bytes = None):
+    """Read all the records of a song data file as a single DataFrame."""
+    return concat_chunks(read_song_chunks(filepath, chunk_rows, max_chunk_bytes), SONG_COLUMNS)
@@ -0,0 +1,79 @@
+import os
+import hashlib
+from sql_queries import manifest_select, manifest_upsert
+
+
+# bytes read at a time when hashing a file
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def file_hash(filepath):
+    """
+    Compute the sha256 of a file reading it in chunks.
+
+    Args:
+        filepath: path of the file.
+
+    Returns:
+        digest: hexadecimal sha256 of the content.
+    """
+    sha = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+def select_new_files(cur, all_files):
+    """
+    Compare the files with the manifest table and keep only the new or changed ones.
+    Size and mtime are checked first, so unchanged files are not read at all; files
+    whose metadata changed but whose content did not get only their manifest record
+    updated. A changed file is processed again whole: its dimensions are upserted and 
+    the songplays already loaded from it are skipped by the unique start_time, user_id 
+    and session_id of the songplays table, so only its new plays are added.
+
+    Args:
+        cur: psycopg2 cursor created from the connection with the DB;
+        all_files: list with the paths of the data files.
+
+    Returns:
+        new_files: list with the paths that still have to be processed, in the same order;
+        records: dict with the manifest record of each path in new_files, to be stored
+        with record_files() once the file is loaded.
+    """
+    cur.execute(manifest_select)
+    manifest = {row[0]: row[1:] for row in cur.fetchall()}
+
+    new_files, records, touched = [], {}, []
+    for filepath in all_files:
+        stored = manifest.get(filepath)
+        stat = os.stat(filepath)
+        if stored and stored[0] == stat.st_size and stored[1] == stat.st_mtime:
+            continue
+
+        record = (filepath, stat.st_size, stat.st_mtime, file_hash(filepath))
+        if stored and stored[2] == record[3]:
+            touched.append(record)
+        else:
+            new_files.append(filepath)
+            records[filepath] = record
+
+    record_files(cur, touched)
+
+    return new_files, records
+
+
+def record_files(cur, records):
+    """
+    Store the manifest records of the files just processed. It should run in the
+    same transaction that loads the files, so a file is never marked as processed
+    without its data.
+
+    Args:
+        cur: psycopg2 cursor created from the connection with the DB;
+        records: list of tuples (filepath, size, mtime, sha256).
+    """
+    if records:
+        cur.executemany(manifest_upsert, records)
@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+
+logger = logging.getLogger("sparkify.etl")
+
+
+class EtlMetrics:
+    """
+    Time spent in each stage of the ETL plus the rows and DB round trips of each table.
+
+    The stages are "discovery", "parse", "transform" and "load"; load is measured per table.
+    It is safe to use from the loader threads of the parallel mode, where the time of a
+    stage is the sum of the time spent by all threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything measured so far."""
+        with self._lock:
+            self.seconds = {}
+            self.rows = {}
+            self.round_trips = {}
+
+    @contextmanager
+    def timer(self, stage, table = ""):
+        """Add the time spent inside the with block to the stage (and table, for loads)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                key = (stage, table)
+                self.seconds[key] = self.seconds.get(key, 0.0) + elapsed
+
+    def count(self, table, rows = 0, round_trips = 0):
+        """Add rows sent to a table and the round trips to the DB needed for them."""
+        with self._lock:
+            self.rows[table] = self.rows.get(table, 0) + rows
+            self.round_trips[table] = self.round_trips.get(table, 0) + round_trips
+
+    def snapshot(self):
+        """Return the measures as a dict that can be pickled, logged or merged."""
+        with self._lock:
+            return {"seconds": [[stage, table, seconds] for (stage, table), seconds in sorted(self.seconds.items())],
+                    "rows": dict(self.rows),
+                    "round_trips": dict(self.round_trips)}
+
+    def merge(self, snapshot):
+        """Add the measures of a snapshot, e.g. the ones taken in a worker process."""
+        with self._lock:
+            for stage, table, seconds in snapshot["seconds"]:
+                self.seconds[(stage, table)] = self.seconds.get((stage, table), 0.0) + seconds
+            for table, rows in snapshot["rows"].items():
+                self.rows[table] = self.rows.get(table, 0) + rows
+            for table, round_trips in snapshot["round_trips"].items():
+                self.round_trips[table] = self.round_trips.get(table, 0) + round_trips
+
+    def log(self, **context):
+        """Write the measures as one json log record, together with the context given."""
+        logger.info(json.dumps(dict(context, **self.snapshot())))
+
+    def write_textfile(self, path):
+        """
+        Write the measures in the Prometheus text format, for the textfile collector
+        of the node exporter. The file is replaced atomically.
+        """
+        snapshot = self.snapshot()
+        lines = ["# HELP sparkify_etl_stage_seconds Time spent in each stage of the ETL.",
+                 "# TYPE sparkify_etl_stage_seconds gauge"]
+        lines += ['sparkify_etl_stage_seconds{{stage="{}",table="{}"}} {:.6f}'.format(stage, table, seconds)
+                  for stage, table, seconds in snapshot["seconds"]]
+        lines += ["# HELP sparkify_etl_rows Rows sent to each table.",
+                  "# TYPE sparkify_etl_rows gauge"]
+        lines += ['sparkify_etl_rows{{table="{}"}} {}'.format(table, rows)
+                  for table, rows in sorted(snapshot["rows"].items())]
+        lines += ["# HELP sparkify_etl_round_trips DB round trips of each table.",
+                  "# TYPE sparkify_etl_round_trips gauge"]
+        lines += ['sparkify_etl_round_trips{{table="{}"}} {}'.format(table, round_trips)
+                  for table, round_trips in sorted(snapshot["round_trips"].items())]
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+
+# measures of the current process, used by all the functions of etl.py
+METRICS = EtlMetrics()
+
+
+def timed_chunks(chunks, metrics = METRICS):
+    """Yield the chunks of a reader adding the time spent producing each one to the parse stage."""
+    chunks = iter(chunks)
+    while True:
+        with metrics.timer("parse"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
@@ -0,0 +1,147 @@
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from sql_queries import song_index_select
+from json_lines import read_song_chunks, rechunk
+
+
+# columns of the lookup index, the first three are the matching key
+INDEX_COLUMNS = ["title", "artist_name", "duration", "song_id", "artist_id"]
+
+# maximum difference allowed between the length of a log event and the duration of a song
+DURATION_TOLERANCE = 1e-6
+
+# default place of the on-disk snapshot of the index
+SNAPSHOT_PATH = "song_index.pkl"
+
+
+def prepare_index(df):
+    """
+    Drop incomplete and repeated keys and sort the index by duration,
+    as required by pandas.merge_asof(). duration is cast to float, as an empty
+    DataFrame would leave it as object and merge_asof() would refuse it.
+
+    Args:
+        df: DataFrame with the INDEX_COLUMNS.
+
+    Returns:
+        index: DataFrame ready to be used by resolve_songs().
+    """
+    index = df[INDEX_COLUMNS].astype({"duration": "float64"})
+    index = index.dropna(subset = ["title", "artist_name", "duration"])
+    index = index.drop_duplicates(subset = ["title", "artist_name", "duration"])
+
+    return index.sort_values("duration").reset_index(drop = True)
+
+
+def files_signature(files):
+    """
+    Summarize a list of files by their number, total size and latest modification time,
+    so a snapshot can tell whether the song files changed without reading them.
+
+    Args:
+        files: list with the paths of the song data files.
+
+    Returns:
+        signature: tuple (number of files, total size, latest mtime).
+    """
+    stats = [os.stat(f) for f in files]
+
+    return (len(stats), sum(s.st_size for s in stats), max((s.st_mtime for s in stats), default = 0))
+
+
+def build_index_from_files(files):
+    """
+    Build the lookup index by reading the song data files.
+
+    Args:
+        files: list with the paths of the song data files.
+
+    Returns:
+        index: DataFrame with the INDEX_COLUMNS sorted by duration.
+    """
+    chunks = [df[INDEX_COLUMNS] for df in rechunk(chunk for f in files for chunk in read_song_chunks(f))]
+    if not chunks:
+        return prepare_index(pd.DataFrame(columns = INDEX_COLUMNS))
+
+    return prepare_index(pd.concat(chunks, ignore_index = True))
+
+
+def build_index_from_db(cur):
+    """
+    Build the lookup index with one query joining the songs and artists tables.
+
+    Args:
+        cur: psycopg2 cursor created from the connection with the DB.
+
+    Returns:
+        index: DataFrame with the INDEX_COLUMNS sorted by duration.
+    """
+    cur.execute(song_index_select)
+    df = pd.DataFrame(cur.fetchall(), columns = INDEX_COLUMNS)
+
+    return prepare_index(df)
+
+
+def load_or_build_index(build, signature, path = SNAPSHOT_PATH, rebuild = False):
+    """
+    Load the index from the snapshot in path if it was built from the same source,
+    otherwise build it again and overwrite the snapshot.
+
+    Args:
+        build: function without arguments returning a new index;
+        signature: any picklable value describing the current state of the source;
+        path: file of the snapshot;
+        rebuild: ignore the snapshot and always build the index.
+
+    Returns:
+        index: DataFrame with the INDEX_COLUMNS sorted by duration.
+    """
+    if not rebuild and os.path.exists(path):
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+        if snapshot["signature"] == signature:
+            return snapshot["index"]
+
+    index = build()
+    with open(path, "wb") as f:
+        pickle.dump({"signature": signature, "index": index}, f)
+
+    return index
+
+
+def resolve_songs(df, index, tolerance = DURATION_TOLERANCE):
+    """
+    Find the song_id and artist_id of every event of a log DataFrame with one
+    merge against the index, matching title and artist name exactly and the
+    length within the tolerance.
+
+    Args:
+        df: log DataFrame with the song, artist and length columns;
+        index: DataFrame returned by one of the build functions above;
+        tolerance: maximum difference between length and duration.
+
+    Returns:
+        df: copy of the parsed DataFrame with the song_id and artist_id columns
+        added (None where no song matches).
+    """
+    if len(index) == 0:
+        nones = pd.Series([None] * len(df), index = df.index, dtype = object)
+        return df.assign(song_id = nones, artist_id = nones)
+
+    events = pd.DataFrame({"title": df.song.values,
+                           "artist_name": df.artist.values,
+                           "duration": pd.to_numeric(df.length).values.astype(float),
+                           "position": np.arange(len(df))})
+    events = events.dropna(subset = ["title", "artist_name", "duration"]).sort_values("duration")
+
+    matched = pd.merge_asof(events, index, on = "duration", by = ["title", "artist_name"],
+                            tolerance = tolerance, direction = "nearest")
+    matched = matched.set_index("position").reindex(range(len(df)))
+    song_ids = pd.Series([s if isinstance(s, str) else None for s in matched.song_id], 
+                         index = df.index, dtype = object)
+    artist_ids = pd.Series([a if isinstance(a, str) else None for a in matched.artist_id], 
+                           index = df.index, dtype = object)
+
+    return df.assign(song_id = song_ids, artist_id = artist_ids)
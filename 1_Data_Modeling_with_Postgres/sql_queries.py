@@ -4,8 +4,12 @@ user_table_drop = "DROP TABLE IF EXISTS users"
 song_table_drop = "DROP TABLE IF EXISTS songs"
 artist_table_drop = "DROP TABLE IF EXISTS artists"
 time_table_drop = "DROP TABLE IF EXISTS time"
+manifest_table_drop = "DROP TABLE IF EXISTS etl_manifest"
 
 # CREATE TABLES
+# a user plays one song at a time in a session, so start_time, user_id and session_id
+# identify a play: the songplays of a log file loaded again (e.g. after it changed)
+# hit this key and are skipped by ON CONFLICT DO NOTHING instead of being added twice
 songplay_table_create = ("""CREATE TABLE IF NOT EXISTS songplays 
     (songplay_id SERIAL PRIMARY KEY, 
     start_time timestamp NOT NULL, 
@@ -15,7 +19,8 @@ songplay_table_create = ("""CREATE TABLE IF NOT EXISTS songplays
     artist_id varchar REFERENCES artists (artist_id),
     session_id int NOT NULL, 
     location text, 
-    user_agent text);""")
+    user_agent text, 
+    UNIQUE (start_time, user_id, session_id));""")
 
 song_table_create = ("""CREATE TABLE IF NOT EXISTS songs 
     (song_id varchar PRIMARY KEY, 
@@ -40,7 +45,7 @@ user_table_create = ("""CREATE TABLE IF NOT EXISTS users
 
 time_table_create = ("""CREATE TABLE IF NOT EXISTS time 
     (time_id SERIAL PRIMARY KEY, 
-    start_time timestamp NOT NULL, 
+    start_time timestamp NOT NULL UNIQUE, 
     hour int, 
     day int, 
     week int, 
@@ -48,6 +53,14 @@ time_table_create = ("""CREATE TABLE IF NOT EXISTS time
     year int, 
     weekday int);""")
 
+# files already loaded by etl.py, so the next runs only process new or changed files
+manifest_table_create = ("""CREATE TABLE IF NOT EXISTS etl_manifest 
+    (filepath text PRIMARY KEY, 
+    size bigint NOT NULL, 
+    mtime double precision NOT NULL, 
+    sha256 varchar(64) NOT NULL, 
+    loaded_at timestamp NOT NULL DEFAULT now());""")
+
 # INSERT RECORDS
 
 songplay_table_insert = ("""INSERT INTO songplays 
@@ -81,7 +94,23 @@ artist_table_insert = ("""INSERT INTO artists (artist_id, name, location, latitu
 time_table_insert = ("""INSERT INTO time 
     (start_time, hour, day, week, month, year, weekday)
     VALUES (%s, %s, %s, %s, %s, %s, %s)
-    ON CONFLICT DO NOTHING;""")
+    ON CONFLICT (start_time) DO NOTHING;""")
+
+manifest_upsert = ("""INSERT INTO etl_manifest 
+    (filepath, size, mtime, sha256) 
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (filepath) 
+    DO UPDATE SET
+        size = EXCLUDED.size,
+        mtime = EXCLUDED.mtime,
+        sha256 = EXCLUDED.sha256,
+        loaded_at = now();""")
+
+manifest_select = "SELECT filepath, size, mtime, sha256 FROM etl_manifest;"
+
+# FULL REFRESH
+# the dimensions are upserted again, but songplays would get every row twice
+full_refresh_queries = ["TRUNCATE TABLE etl_manifest, songplays;"]
 
 # FIND SONGS
 
@@ -91,7 +120,143 @@ song_select = ("""SELECT s.song_id, s.artist_id
     ON s.artist_id = a.artist_id
     WHERE s.title = %s AND a.name = %s AND s.duration = %s;""")
 
+# STAGING TABLES (bulk load)
+# temporary tables live as long as the connection and are emptied at every commit,
+# so each bulk batch starts from clean staging tables. Inside a batch the loader also
+# empties them after every merge (staging_truncate), so each chunk is merged alone.
+
+songplay_staging_create = ("""CREATE TEMP TABLE IF NOT EXISTS songplays_staging 
+    (songplay_id int, 
+    start_time timestamp, 
+    user_id int, 
+    level varchar, 
+    song text, 
+    artist text, 
+    length float, 
+    song_id varchar, 
+    artist_id varchar, 
+    session_id int, 
+    location text, 
+    user_agent text)
+    ON COMMIT DELETE ROWS;""")
+
+song_staging_create = ("""CREATE TEMP TABLE IF NOT EXISTS songs_staging 
+    (song_id varchar, 
+    title text, 
+    artist_id varchar, 
+    year int, 
+    duration float)
+    ON COMMIT DELETE ROWS;""")
+
+artist_staging_create = ("""CREATE TEMP TABLE IF NOT EXISTS artists_staging 
+    (ordinal int, 
+    artist_id varchar, 
+    name text, 
+    location text, 
+    latitude float, 
+    longitude float)
+    ON COMMIT DELETE ROWS;""")
+
+user_staging_create = ("""CREATE TEMP TABLE IF NOT EXISTS users_staging 
+    (ordinal int, 
+    user_id int, 
+    first_name varchar, 
+    last_name varchar, 
+    gender varchar(1), 
+    level varchar)
+    ON COMMIT DELETE ROWS;""")
+
+time_staging_create = ("""CREATE TEMP TABLE IF NOT EXISTS time_staging 
+    (start_time timestamp, 
+    hour int, 
+    day int, 
+    week int, 
+    month int, 
+    year int, 
+    weekday int)
+    ON COMMIT DELETE ROWS;""")
+
+# the columns are filled in by the loader with the ones of the DataFrame being copied.
+# missing values are written as \N so empty strings are kept as they are.
+staging_copy = "COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '\\N');"
+
+# empties a staging table once its rows were merged, filled in with the name of the table
+staging_truncate = "TRUNCATE {};"
+
+# MERGE RECORDS (bulk load)
+# same conflict handling as the single row inserts above. DISTINCT ON keeps only the
+# last row of each key in the batch, as an upsert can not touch the same row twice.
+
+songplay_table_merge = ("""INSERT INTO songplays 
+    (songplay_id, start_time, user_id, level, song_id, artist_id, session_id, location, user_agent) 
+    SELECT st.songplay_id, st.start_time, st.user_id, st.level, s.song_id, s.artist_id, 
+        st.session_id, st.location, st.user_agent
+    FROM songplays_staging AS st
+    LEFT JOIN (songs AS s JOIN artists AS a ON s.artist_id = a.artist_id)
+    ON s.title = st.song AND a.name = st.artist AND s.duration = st.length
+    ON CONFLICT DO NOTHING;""")
+
+# used when song_id and artist_id were already found with the song lookup index
+songplay_table_merge_resolved = ("""INSERT INTO songplays 
+    (songplay_id, start_time, user_id, level, song_id, artist_id, session_id, location, user_agent) 
+    SELECT songplay_id, start_time, user_id, level, song_id, artist_id, session_id, location, user_agent
+    FROM songplays_staging
+    ON CONFLICT DO NOTHING;""")
+
+user_table_merge = ("""INSERT INTO users 
+    (user_id, first_name, last_name, gender, level) 
+    SELECT DISTINCT ON (user_id) user_id, first_name, last_name, gender, level
+    FROM users_staging
+    ORDER BY user_id, ordinal DESC
+    ON CONFLICT (user_id) 
+    DO UPDATE SET
+        last_name = EXCLUDED.last_name,
+        gender = EXCLUDED.gender,
+        level = EXCLUDED.level;""")
+
+song_table_merge = ("""INSERT INTO songs 
+    (song_id, title, artist_id, year, duration) 
+    SELECT song_id, title, artist_id, year, duration
+    FROM songs_staging
+    ON CONFLICT DO NOTHING;""")
+
+artist_table_merge = ("""INSERT INTO artists (artist_id, name, location, latitude, longitude) 
+    SELECT DISTINCT ON (artist_id) artist_id, name, location, latitude, longitude
+    FROM artists_staging
+    ORDER BY artist_id, ordinal DESC
+    ON CONFLICT (artist_id)
+    DO UPDATE SET
+        name = EXCLUDED.name,
+        location = EXCLUDED.location,
+        latitude = EXCLUDED.latitude,
+        longitude = EXCLUDED.longitude;""")
+
+time_table_merge = ("""INSERT INTO time 
+    (start_time, hour, day, week, month, year, weekday)
+    SELECT start_time, hour, day, week, month, year, weekday
+    FROM time_staging
+    ON CONFLICT (start_time) DO NOTHING;""")
+
+# the bulk loader numbers the songplays itself, starting after the highest id stored
+songplay_max_id = "SELECT COALESCE(MAX(songplay_id), 0) FROM songplays;"
+
+# the whole songs x artists join, used to build the in-memory song lookup index
+song_index_select = ("""SELECT s.title, a.name, s.duration, s.song_id, s.artist_id 
+    FROM artists AS a
+    JOIN songs AS s
+    ON s.artist_id = a.artist_id;""")
+
+# number of rows and md5 of the content of the songs x artists join, the signature of the
+# snapshot of the lookup index built from the DB: it changes with any row updated in place
+song_index_signature = ("""SELECT COUNT(*), 
+    md5(string_agg(concat_ws('|', s.song_id, s.title, s.artist_id, a.name, s.duration), E'\\n' 
+        ORDER BY s.song_id, s.artist_id))
+    FROM artists AS a
+    JOIN songs AS s
+    ON s.artist_id = a.artist_id;""")
+
 # QUERY LISTS
 
-create_table_queries = [user_table_create, artist_table_create, song_table_create, time_table_create, songplay_table_create]
-drop_table_queries = [songplay_table_drop, user_table_drop, song_table_drop, artist_table_drop, time_table_drop]
\ No newline at end of file
+create_table_queries = [user_table_create, artist_table_create, song_table_create, time_table_create, songplay_table_create, manifest_table_create]
+drop_table_queries = [songplay_table_drop, user_table_drop, song_table_drop, artist_table_drop, time_table_drop, manifest_table_drop]
+create_staging_queries = [songplay_staging_create, song_staging_create, artist_staging_create, user_staging_create, time_staging_create]
\ No newline at end of file
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+
+# columns of the time table, in the order of time_table_insert
+TIME_COLUMNS = ["start_time", "hour", "day", "week", "month", "year", "weekday"]
+
+
+def build_time_table(ts, loaded = None):
+    """
+    Build the time records of a batch of events in one vectorized pass. The
+    timestamps are deduplicated first, then the ones already in the loaded cache
+    are dropped, and only then the calendar attributes are derived, so each
+    timestamp is processed and emitted once per run.
+
+    Args:
+        ts: Series or array with the event timestamps in milliseconds (the log ts column);
+        loaded: set with the timestamps (in milliseconds) already emitted, updated in
+        place with the new ones. None to only deduplicate inside the batch.
+
+    Returns:
+        time_df: DataFrame with the TIME_COLUMNS and one row per new timestamp.
+    """
+    ts = pd.unique(np.asarray(ts, dtype = "int64"))
+    if loaded is not None:
+        ts = ts[np.fromiter((t not in loaded for t in ts.tolist()), dtype = bool, count = len(ts))]
+        loaded.update(ts.tolist())
+
+    t = pd.Series(pd.to_datetime(ts, unit = "ms"))
+
+    return pd.DataFrame({"start_time": t,
+                         "hour": t.dt.hour,
+                         "day": t.dt.day,
+                         "week": t.dt.isocalendar().week.astype("int64"),
+                         "month": t.dt.month,
+                         "year": t.dt.year,
+                         "weekday": t.dt.weekday}, columns = TIME_COLUMNS)
@@ -0,0 +1,171 @@
+import csv
+import time
+import argparse
+
+from cassandra.cluster import Cluster
+from cassandra.concurrent import execute_concurrent
+from cassandra.query import BatchStatement, BatchType
+
+from cql_queries import *
+from table_design import ACCESS_PATTERNS
+
+
+EVENT_FILE = 'event_datafile_new.csv'
+
+# maximum number of statements waiting for the cluster at the same time
+CONCURRENCY = 64
+
+# maximum number of rows of one partition sent together in an unlogged batch
+BATCH_ROWS = 20
+
+# maximum number of rows kept waiting for more rows of their partition
+BUFFER_ROWS = 10000
+
+
+# tables filled from each row of event_datafile_new.csv, see table_design.py
+TABLE_LOADS = ACCESS_PATTERNS
+
+
+def read_events(filepath):
+    """Read the rows of the event data csv one at a time, as dicts keyed by its header."""
+    with open(filepath, encoding = 'utf8', newline = '') as f:
+        for row in csv.DictReader(f):
+            yield row
+
+
+def group_by_partition(rows, table_loads = TABLE_LOADS, batch_rows = BATCH_ROWS, buffer_rows = BUFFER_ROWS):
+    """
+    Fan each event row out to every table and group the values of each table by
+    partition key, so the rows of a group can be written with a single unlogged batch
+    that goes to one replica set.
+
+    A group is released when it has batch_rows rows, and all of them are released
+    whenever buffer_rows rows are waiting, so the memory used does not depend on the
+    size of the file.
+
+    Args:
+        rows: iterable with the event rows, see read_events();
+        table_loads: list of AccessPattern with the tables to fill;
+        batch_rows: maximum number of rows of a group;
+        buffer_rows: maximum number of rows waiting in all groups.
+
+    Yields:
+        (table_load, values): the AccessPattern and a list with the values of rows of one partition.
+    """
+    pending = {}
+    buffered = 0
+    for row in rows:
+        for table_load in table_loads:
+            values = table_load.values(row)
+            key = (table_load.name, values[:table_load.partition_columns])
+            group = pending.setdefault(key, [])
+            group.append(values)
+            buffered += 1
+
+            if len(group) >= batch_rows:
+                del pending[key]
+                buffered -= len(group)
+                yield table_load, group
+
+        if buffered >= buffer_rows:
+            yield from release(pending, table_loads)
+            pending, buffered = {}, 0
+
+    yield from release(pending, table_loads)
+
+
+def release(pending, table_loads):
+    """Yield every group waiting in pending, see group_by_partition()."""
+    by_name = {table_load.name: table_load for table_load in table_loads}
+    for (name, _), group in pending.items():
+        yield by_name[name], group
+
+
+def build_statement(prepared, group):
+    """
+    Return the statement and parameters writing a group of rows of one partition:
+    the prepared insert itself for a single row or an unlogged batch of them.
+    """
+    if len(group) == 1:
+        return prepared, group[0]
+
+    batch = BatchStatement(batch_type = BatchType.UNLOGGED)
+    for values in group:
+        batch.add(prepared, values)
+
+    return batch, None
+
+
+def load_events(session, filepath = EVENT_FILE, table_loads = TABLE_LOADS, concurrency = CONCURRENCY,
+                batch_rows = BATCH_ROWS, buffer_rows = BUFFER_ROWS):
+    """
+    Read the event data csv once and write its rows into all the tables, with the
+    inserts prepared once and at most concurrency statements in flight.
+
+    Args:
+        session: cassandra Session connected to the keyspace of the tables;
+        filepath: path of the event data csv;
+        table_loads: list of AccessPattern with the tables to fill;
+        concurrency: maximum number of statements waiting for the cluster;
+        batch_rows: maximum number of rows of one partition in an unlogged batch;
+        buffer_rows: maximum number of rows waiting for more rows of their partition.
+
+    Returns:
+        counts: dict with the number of rows written to each table.
+    """
+    prepared = {table_load.name: session.prepare(table_load.insert) for table_load in table_loads}
+    counts = dict.fromkeys(prepared, 0)
+
+    def statements():
+        for table_load, group in group_by_partition(read_events(filepath), table_loads, batch_rows, buffer_rows):
+            counts[table_load.name] += len(group)
+            yield build_statement(prepared[table_load.name], group)
+
+    # the statements are generated as the previous ones complete, the first error is raised
+    for _ in execute_concurrent(session, statements(), concurrency = concurrency,
+                                raise_on_first_error = True, results_generator = True):
+        pass
+
+    return counts
+
+
+def main():
+    """
+    Connect to the cluster, create the keyspace and the tables of the 3 questions and
+    load event_datafile_new.csv into them, printing the rows written and the time spent.
+    """
+    parser = argparse.ArgumentParser(description = 'Load the event data csv into the sparkify keyspace.')
+    parser.add_argument('--hosts', nargs = '+', default = ['127.0.0.1'], help = 'contact points of the cluster')
+    parser.add_argument('--file', default = EVENT_FILE, help = 'event data csv to load')
+    parser.add_argument('--concurrency', type = int, default = CONCURRENCY,
+                        help = 'maximum number of statements in flight')
+    parser.add_argument('--batch-rows', type = int, default = BATCH_ROWS,
+                        help = 'maximum number of rows of one partition per unlogged batch, 1 to disable batches')
+    parser.add_argument('--drop', action = 'store_true', help = 'drop the tables before loading them')
+    args = parser.parse_args()
+
+    cluster = Cluster(args.hosts)
+    session = cluster.connect()
+    try:
+        session.execute(keyspace_create)
+        session.set_keyspace('sparkify')
+        if args.drop:
+            for query in drop_table_queries:
+                session.execute(query)
+        for query in create_table_queries:
+            session.execute(query)
+
+        start = time.perf_counter()
+        counts = load_events(session, args.file, concurrency = args.concurrency, batch_rows = args.batch_rows)
+        elapsed = time.perf_counter() - start
+
+        for table, rows in counts.items():
+            print('{} rows written to {}.'.format(rows, table))
+        print('Data loaded in {:.2f}s, {:.0f} rows/s.'.format(elapsed, sum(counts.values()) / max(elapsed, 1e-9)))
+    finally:
+        session.shutdown()
+        cluster.shutdown()
+
+
+if __name__ == "__main__":
+    main()
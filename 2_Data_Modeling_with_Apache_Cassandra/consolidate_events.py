@@ -0,0 +1,208 @@
+import os
+import csv
+import glob
+import zlib
+import heapq
+import argparse
+import itertools
+import tempfile
+import multiprocessing
+from collections import deque
+
+
+EVENT_DATA = 'event_data'
+EVENT_FILE = 'event_datafile_new.csv'
+
+# columns of event_datafile_new.csv and their position in the daily event files
+OUTPUT_COLUMNS = ['artist', 'firstName', 'gender', 'itemInSession', 'lastName', 'length',
+                  'level', 'location', 'sessionId', 'song', 'userId']
+SOURCE_INDEXES = [0, 2, 3, 4, 5, 6, 7, 8, 12, 13, 16]
+
+# partition key and clustering columns of each table, used to shard and sort the output
+PARTITION_KEYS = {'usage_library': (['sessionId'], ['itemInSession']),
+                  'artist_and_song_library': (['userId', 'sessionId'], ['itemInSession']),
+                  'user_library': (['song'], ['userId'])}
+
+INT_COLUMNS = {'itemInSession', 'sessionId', 'userId'}
+
+# rows of a shard sorted in memory at a time, the sorted runs are then merged from disk
+SORT_RUN_ROWS = 100000
+
+
+def list_event_files(filepath):
+    """Collect the csv files of every folder under filepath, sorted by path (i.e. by day)."""
+    return sorted(glob.glob(os.path.join(filepath, '**', '*.csv'), recursive = True))
+
+
+def read_event_file(filepath):
+    """
+    Read one daily event file and keep the OUTPUT_COLUMNS of the events with an
+    artist, i.e. of the songs played. Runs in the worker processes.
+
+    Args:
+        filepath: path of the daily event csv.
+
+    Returns:
+        rows: list with the values of the OUTPUT_COLUMNS of each event kept.
+    """
+    with open(filepath, 'r', encoding = 'utf8', newline = '') as csvfile:
+        csvreader = csv.reader(csvfile)
+        next(csvreader)
+        return [[line[i] for i in SOURCE_INDEXES] for line in csvreader if line and line[0] != '']
+
+
+def read_events(files, workers, max_pending = None):
+    """
+    Read the daily event files with a pool of worker processes, yielding their rows
+    in file order. A new file is only sent to the pool when the oldest one is taken
+    back, so at most max_pending files (2 per worker by default) are being read or
+    waiting to be written, however slow the writer is.
+    """
+    max_pending = max_pending or 2 * workers
+    files = iter(files)
+    with multiprocessing.Pool(workers) as pool:
+        pending = deque(pool.apply_async(read_event_file, (filepath,))
+                        for filepath in itertools.islice(files, max_pending))
+        while pending:
+            rows = pending.popleft().get()
+            for filepath in itertools.islice(files, 1):
+                pending.append(pool.apply_async(read_event_file, (filepath,)))
+            yield from rows
+
+
+def create_writer(f):
+    """Return a csv writer quoting every value, as in event_datafile_new.csv, after writing the header."""
+    writer = csv.writer(f, quoting = csv.QUOTE_ALL, skipinitialspace = True)
+    writer.writerow(OUTPUT_COLUMNS)
+
+    return writer
+
+
+def write_events(rows, output):
+    """Write the rows to a single csv as they are read, returning how many were written."""
+    num_rows = 0
+    with open(output, 'w', encoding = 'utf8', newline = '') as f:
+        writer = create_writer(f)
+        for row in rows:
+            writer.writerow(row)
+            num_rows += 1
+
+    return num_rows
+
+
+def sort_key(columns):
+    """Return a function giving the values of the columns of a row, with the numeric ones as int."""
+    indexes = [(OUTPUT_COLUMNS.index(column), column in INT_COLUMNS) for column in columns]
+
+    return lambda row: tuple(int(row[i]) if is_int else row[i] for i, is_int in indexes)
+
+
+def sort_shard(path, key, run_rows = SORT_RUN_ROWS):
+    """
+    Sort a csv shard by key without holding it in memory: runs of at most run_rows rows
+    are sorted and written to temporary files next to it, and then merged back into it.
+
+    Args:
+        path: csv file with the header of create_writer();
+        key: function giving the sort key of a row, from sort_key();
+        run_rows: maximum number of rows in memory at a time.
+    """
+    runs = []
+    try:
+        with open(path, 'r', encoding = 'utf8', newline = '') as f:
+            csvreader = csv.reader(f)
+            next(csvreader)
+            while True:
+                rows = sorted(itertools.islice(csvreader, run_rows), key = key)
+                if not rows:
+                    break
+                with tempfile.NamedTemporaryFile('w', encoding = 'utf8', newline = '', suffix = '.run',
+                                                 dir = os.path.dirname(path), delete = False) as run:
+                    csv.writer(run).writerows(rows)
+                runs.append(run.name)
+
+        run_files = [open(run, 'r', encoding = 'utf8', newline = '') for run in runs]
+        try:
+            with open(path, 'w', encoding = 'utf8', newline = '') as f:
+                create_writer(f).writerows(heapq.merge(*[csv.reader(run) for run in run_files], key = key))
+        finally:
+            for run in run_files:
+                run.close()
+    finally:
+        for run in runs:
+            os.remove(run)
+
+
+def write_shards(rows, output_dir, table, num_shards, run_rows = SORT_RUN_ROWS):
+    """
+    Write the rows to num_shards csv files, each partition of the table always going
+    to the same shard, and then sort each shard by partition key and clustering columns.
+    The rows are written as they are read and each shard is sorted in runs of run_rows
+    rows merged from disk (sort_shard()), so the memory does not grow with the events.
+
+    Args:
+        rows: iterable with the rows of the OUTPUT_COLUMNS;
+        output_dir: folder where the shards are written;
+        table: key of PARTITION_KEYS whose partitions are used;
+        num_shards: number of shards;
+        run_rows: maximum number of rows sorted in memory at a time.
+
+    Returns:
+        num_rows: number of rows written.
+    """
+    partition_columns, clustering_columns = PARTITION_KEYS[table]
+    partition_key = sort_key(partition_columns)
+    paths = [os.path.join(output_dir, '{}-{:04d}.csv'.format(table, shard)) for shard in range(num_shards)]
+
+    num_rows = 0
+    files = [open(path, 'w', encoding = 'utf8', newline = '') for path in paths]
+    try:
+        writers = [create_writer(f) for f in files]
+        for row in rows:
+            shard = zlib.crc32(repr(partition_key(row)).encode('utf8')) % num_shards
+            writers[shard].writerow(row)
+            num_rows += 1
+    finally:
+        for f in files:
+            f.close()
+
+    key = sort_key(partition_columns + clustering_columns)
+    for path in paths:
+        sort_shard(path, key, run_rows)
+
+    return num_rows
+
+
+def main():
+    """
+    Consolidate the daily event files of event_data into event_datafile_new.csv or,
+    with --shard-by, into shards sorted by the partition key of one of the tables.
+    """
+    parser = argparse.ArgumentParser(description = 'Consolidate the daily event files for the Cassandra tables.')
+    parser.add_argument('--input', default = EVENT_DATA, help = 'folder with the daily event csv files')
+    parser.add_argument('--output', default = EVENT_FILE,
+                        help = 'csv file to write, or folder of the shards with --shard-by')
+    parser.add_argument('--workers', type = int, default = os.cpu_count(),
+                        help = 'number of processes reading the files')
+    parser.add_argument('--shard-by', choices = sorted(PARTITION_KEYS),
+                        help = 'write shards sorted by the partition key of this table')
+    parser.add_argument('--shards', type = int, default = 16, help = 'number of shards with --shard-by')
+    parser.add_argument('--sort-run-rows', type = int, default = SORT_RUN_ROWS,
+                        help = 'rows of a shard sorted in memory at a time with --shard-by')
+    args = parser.parse_args()
+
+    files = list_event_files(args.input)
+    print('{} files found in {}.'.format(len(files), args.input))
+
+    rows = read_events(files, args.workers)
+    if args.shard_by:
+        os.makedirs(args.output, exist_ok = True)
+        num_rows = write_shards(rows, args.output, args.shard_by, args.shards, args.sort_run_rows)
+    else:
+        num_rows = write_events(rows, args.output)
+
+    print('{} rows written to {}.'.format(num_rows, args.output))
+
+
+if __name__ == "__main__":
+    main()
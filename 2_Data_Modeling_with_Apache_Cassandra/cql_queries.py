@@ -0,0 +1,34 @@
+from table_design import USAGE_LIBRARY, ARTIST_AND_SONG_LIBRARY, USER_LIBRARY, ACCESS_PATTERNS
+
+# KEYSPACE
+keyspace_create = ("""CREATE KEYSPACE IF NOT EXISTS sparkify
+    WITH REPLICATION =
+    {'class' : 'SimpleStrategy',
+    'replication_factor' : 1}""")
+
+# the queries of the tables are generated from their access patterns in table_design.py
+
+# DROP TABLES
+usage_library_drop = USAGE_LIBRARY.drop_query()
+artist_and_song_library_drop = ARTIST_AND_SONG_LIBRARY.drop_query()
+user_library_drop = USER_LIBRARY.drop_query()
+
+# CREATE TABLES
+usage_library_create = USAGE_LIBRARY.create_query()
+artist_and_song_library_create = ARTIST_AND_SONG_LIBRARY.create_query()
+user_library_create = USER_LIBRARY.create_query()
+
+# INSERT RECORDS (prepared once, the values are bound with ?)
+usage_library_insert = USAGE_LIBRARY.insert_query()
+artist_and_song_library_insert = ARTIST_AND_SONG_LIBRARY.insert_query()
+user_library_insert = USER_LIBRARY.insert_query()
+
+# QUERIES OF THE 3 QUESTIONS
+usage_library_select = USAGE_LIBRARY.select_query()
+artist_and_song_library_select = ARTIST_AND_SONG_LIBRARY.select_query()
+user_library_select = USER_LIBRARY.select_query()
+
+# QUERY LISTS
+
+create_table_queries = [pattern.create_query() for pattern in ACCESS_PATTERNS]
+drop_table_queries = [pattern.drop_query() for pattern in ACCESS_PATTERNS]
@@ -0,0 +1,154 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+# python type of the values bound to each cql type
+CQL_TYPES = {'int': int, 'float': float, 'text': str}
+
+
+class AccessPattern:
+    """
+    One query of the app and the table modeled for it: the columns of the WHERE clause
+    are the partition key (plus the clustering columns for a single row lookup), the
+    ones giving the order of the rows are the clustering columns and the other ones 
+    asked for are the data columns. From them the CREATE TABLE, the INSERT and the 
+    SELECT of the table are generated.
+
+    Each column is a tuple (name, cql type, column of event_datafile_new.csv), and
+    where lists the columns of the WHERE clause when it is not only the partition key.
+    """
+
+    def __init__(self, name, partition_key, clustering = (), data = (), selected = None, where = None):
+        self.name = name
+        self.partition_key = list(partition_key)
+        self.clustering = list(clustering)
+        self.data = list(data)
+        self.columns = self.partition_key + self.clustering + self.data
+        self.selected = list(selected) if selected is not None else [column for column, _, _ in self.data]
+        self.where = list(where) if where is not None else [column for column, _, _ in self.partition_key]
+
+        # used by cassandra_loader.py to group the rows of a partition
+        self.partition_columns = len(self.partition_key)
+        self.insert = self.insert_query()
+
+    def create_query(self):
+        """Return the CREATE TABLE of the table."""
+        partition = ", ".join(column for column, _, _ in self.partition_key)
+        if len(self.partition_key) > 1:
+            partition = "({})".format(partition)
+        primary_key = ", ".join([partition] + [column for column, _, _ in self.clustering])
+
+        columns = ",\n    ".join("{} {}".format(column, cql_type) for column, cql_type, _ in self.columns)
+        return "CREATE TABLE IF NOT EXISTS {}\n    ({},\n    PRIMARY KEY ({}))".format(self.name, columns, primary_key)
+
+    def drop_query(self):
+        """Return the DROP TABLE of the table."""
+        return "DROP TABLE IF EXISTS {}".format(self.name)
+
+    def insert_query(self):
+        """Return the INSERT of one row, to be prepared with its values bound with ?."""
+        return "INSERT INTO {}\n    ({})\n    VALUES ({})".format(
+            self.name, ", ".join(column for column, _, _ in self.columns), ", ".join("?" * len(self.columns)))
+
+    def select_query(self):
+        """Return the SELECT of the access pattern, with the values of the where columns bound with ?."""
+        where = "\n    AND ".join("{} = ?".format(column) for column in self.where)
+        return "SELECT {}\n    FROM {}\n    WHERE {}".format(", ".join(self.selected), self.name, where)
+
+    def values(self, row):
+        """Return the values of the INSERT from a row of event_datafile_new.csv read as a dict."""
+        return tuple(CQL_TYPES[cql_type](row[source]) for _, cql_type, source in self.columns)
+
+
+# 1. artist, song title and song's length heard during a sessionId and itemInSession
+USAGE_LIBRARY = AccessPattern(
+    'usage_library',
+    partition_key = [('session_id', 'int', 'sessionId')],
+    clustering = [('item_in_session', 'int', 'itemInSession')],
+    data = [('artist_name', 'text', 'artist'), ('song_name', 'text', 'song'), ('song_length', 'float', 'length')],
+    where = ['session_id', 'item_in_session'])
+
+# 2. artist, song (sorted by itemInSession) and user name of a userid and sessionid
+ARTIST_AND_SONG_LIBRARY = AccessPattern(
+    'artist_and_song_library',
+    partition_key = [('user_id', 'int', 'userId'), ('session_id', 'int', 'sessionId')],
+    clustering = [('item_in_session', 'int', 'itemInSession')],
+    data = [('artist_name', 'text', 'artist'), ('song_name', 'text', 'song'),
+            ('user_first_name', 'text', 'firstName'), ('user_last_name', 'text', 'lastName')])
+
+# 3. every user name who listened to a song
+USER_LIBRARY = AccessPattern(
+    'user_library',
+    partition_key = [('song_name', 'text', 'song')],
+    clustering = [('user_id', 'int', 'userId')],
+    data = [('user_first_name', 'text', 'firstName'), ('user_last_name', 'text', 'lastName')])
+
+ACCESS_PATTERNS = [USAGE_LIBRARY, ARTIST_AND_SONG_LIBRARY, USER_LIBRARY]
+
+
+class ResultCache:
+    """
+    Least recently used cache of query results whose entries expire after ttl seconds,
+    so repeated queries on hot partitions do not go to the cluster every time.
+    """
+
+    def __init__(self, max_entries = 1024, ttl = 60, clock = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (True, result) when key is cached and not expired, (False, None) otherwise."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, result):
+        """Cache the result of key, dropping the least recently used entries above max_entries."""
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last = False)
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+
+
+class PatternQueries:
+    """
+    Run the SELECT of the access patterns with statements prepared once, keeping the
+    rows of each partition in a ResultCache.
+    """
+
+    def __init__(self, session, patterns = ACCESS_PATTERNS, cache = None):
+        self.session = session
+        self.cache = cache if cache is not None else ResultCache()
+        self.prepared = {pattern.name: session.prepare(pattern.select_query()) for pattern in patterns}
+
+    def query(self, name, *values):
+        """
+        Return the rows of the access pattern of table name for the values of its
+        where columns, e.g. query('usage_library', 338, 4).
+        """
+        key = (name, values)
+        hit, rows = self.cache.get(key)
+        if not hit:
+            rows = list(self.session.execute(self.prepared[name], values))
+            self.cache.put(key, rows)
+
+        return rows
@@ -0,0 +1,106 @@
+import time
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class ConnectionPool:
+    """Connections opened on demand, up to size, and shared by the threads of the executor."""
+
+    def __init__(self, connect, size):
+        self.connect = connect
+        self.size = size
+        self.opened = []
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Return an idle connection, opening a new one while there are less than size."""
+        with self._lock:
+            if self._idle.empty() and len(self.opened) < self.size:
+                conn = self.connect()
+                self.opened.append(conn)
+                return conn
+
+        return self._idle.get()
+
+    def release(self, conn):
+        """Give a connection back to the pool."""
+        self._idle.put(conn)
+
+    def close(self):
+        """Close every connection opened."""
+        for conn in self.opened:
+            conn.close()
+
+
+def run_step(pool, name, query, depends_on):
+    """Run the query of one step on a connection of the pool and commit it, measuring its time and rows."""
+    conn = pool.acquire()
+    try:
+        cur = conn.cursor()
+        start = time.perf_counter()
+        cur.execute(query)
+        conn.commit()
+        seconds = time.perf_counter() - start
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.release(conn)
+
+    return {'table': name, 'depends_on': depends_on, 'seconds': round(seconds, 3), 'rows': cur.rowcount}
+
+
+def run_dag(steps, connect, workers = 4):
+    """
+    Run the steps as soon as all the steps they depend on are committed, at most workers 
+    of them at the same time, each one on a connection of a pool.
+
+    Args:
+        steps: list of tuples (name, query, names of the steps it depends on), see insert_table_steps;
+        connect: function without arguments returning a new connection;
+        workers: number of threads and of connections.
+
+    Returns:
+        report: list with the table, dependencies, seconds and rows inserted of each step, in the 
+        order they finished. The first error stops new steps from starting and is raised once the
+        running ones finish.
+    """
+    names = {name for name, _, _ in steps}
+    for name, _, depends_on in steps:
+        missing = set(depends_on) - names
+        if missing:
+            raise ValueError('step {} depends on unknown steps {}'.format(name, sorted(missing)))
+
+    pool = ConnectionPool(connect, workers)
+    waiting = list(steps)
+    done = set()
+    running = {}
+    report = []
+
+    try:
+        with ThreadPoolExecutor(workers) as executor:
+            while waiting or running:
+                for step in [step for step in waiting if set(step[2]) <= done]:
+                    waiting.remove(step)
+                    running[executor.submit(run_step, pool, *step)] = step[0]
+
+                if not running:
+                    raise ValueError('circular dependencies between the steps {}'.format(
+                        sorted(name for name, _, _ in waiting)))
+
+                finished, _ = wait(running, return_when = FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    if future.exception() is not None:
+                        # do not start new steps, wait for the running ones and raise
+                        waiting = []
+                        wait(running)
+                        raise future.exception()
+                    report.append(future.result())
+                    done.add(name)
+    finally:
+        pool.close()
+
+    return report
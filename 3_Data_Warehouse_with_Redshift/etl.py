@@ -1,32 +1,49 @@
+import time
+import argparse
+import functools
 import configparser
 import psycopg2
-from sql_queries import copy_table_queries, insert_table_queries
+from sql_queries import copy_table_queries, insert_table_queries, insert_table_steps
+from dag_executor import run_dag
+from staging_copy import copy_options, load_staging_tables_parallel
+from incremental import load_incremental, record_full_load
+from profiler import QueryProfiler
 
 
-def load_staging_tables(cur, conn):
+def execute(cur, query, profiler = None):
+    """ Function to run a query with the profiler, when there is one, or directly with the cursor. """
+    if profiler is None:
+        cur.execute(query)
+    else:
+        profiler.execute(cur, query)
+
+
+def load_staging_tables(cur, conn, profiler = None):
     """ Function to upload the staging tables from files in S3 to tables in a Redshift Cluster
     and then commit each one after its executions.
 
     Args:
         cur: cursor to execute the queries in Redshift;
-        conn: connection in order to commit every query done.
+        conn: connection in order to commit every query done;
+        profiler: QueryProfiler recording each COPY, None to run them without profiling.
     """
 
     for query in copy_table_queries:
-        cur.execute(query)
+        execute(cur, query, profiler)
         conn.commit()
 
 
-def insert_tables(cur, conn):
+def insert_tables(cur, conn, profiler = None):
     """ Function to run the insert queries that take data from the staging table and upload to
     the table that the query belongs. It commits every query after executing it
 
     Args:
         cur: cursor to execute the queries in Redshift;
-        conn: connection in order to commit every query done.
+        conn: connection in order to commit every query done;
+        profiler: QueryProfiler recording each insert, None to run them without profiling.
     """
     for query in insert_table_queries:
-        cur.execute(query)
+        execute(cur, query, profiler)
         conn.commit()
 
 
@@ -36,16 +53,72 @@ def main():
     
     After that the function creates a cursor and pass both to the functions for uploading data to the
     staging tables and analytical tables.
+
+    With --staging manifest the source prefixes are listed first, the files are written to a
+    COPY manifest and both staging tables are copied
+    at the same time on separate connections.
+
+    With --inserts dag the insert queries run as soon as the tables they read from are loaded
+    (only time_table waits for songplay_table), up to --workers at the same time, and the time
+    and rows of each one are printed.
+
+    With --load incremental only the log partitions and song files that arrived after the 
+    watermarks of the last run are staged, the dimensions are merged and the new songplays 
+    appended (see incremental.py). The default full load stores the watermarks at the end.
+
+    With --profile REPORT.json the serial COPYs and inserts are explained before running and
+    their time, rows, query summary and load errors are written to the report (see profiler.py);
+    compare two reports with python profiler.py OLD.json NEW.json.
     """
+    parser = argparse.ArgumentParser(description = 'Load the S3 data into the Redshift cluster.')
+    parser.add_argument('--staging', choices = ['serial', 'manifest'], default = 'serial',
+                        help = 'COPY the whole prefixes one after the other or parallel COPYs of manifests')
+    parser.add_argument('--gzip', action = 'store_true', help = 'the source files are gzip compressed')
+    parser.add_argument('--compupdate', choices = ['ON', 'OFF'], help = 'COMPUPDATE option of the COPYs')
+    parser.add_argument('--statupdate', choices = ['ON', 'OFF'], help = 'STATUPDATE option of the COPYs')
+    parser.add_argument('--slices', type = int, help = 'slices of the cluster, by default read from stv_slices')
+    parser.add_argument('--inserts', choices = ['serial', 'dag'], default = 'serial',
+                        help = 'run the insert queries one after the other or concurrently in dependency order')
+    parser.add_argument('--workers', type = int, default = 4, help = 'connections running inserts with --inserts dag')
+    parser.add_argument('--load', choices = ['full', 'incremental'], default = 'full',
+                        help = 'load all the history into new tables or only what arrived since the last run')
+    parser.add_argument('--profile', metavar = 'REPORT', help = 'write the plan, time and rows of each statement to this json file')
+    args = parser.parse_args()
+    if args.profile and (args.staging != 'serial' or args.inserts != 'serial' or args.load != 'full'):
+        parser.error('--profile records the serial statements of the full load only')
 
     config = configparser.ConfigParser()
     config.read('dwh.cfg')
 
-    conn = psycopg2.connect("host={} dbname={} user={} password={} port={}".format(*config['CLUSTER'].values()))
+    dsn = "host={} dbname={} user={} password={} port={}".format(*config['CLUSTER'].values())
+    conn = psycopg2.connect(dsn)
     cur = conn.cursor()
-    
-    load_staging_tables(cur, conn)
-    insert_tables(cur, conn)
+
+    options = copy_options(args.gzip, args.compupdate, args.statupdate)
+    if args.load == 'incremental':
+        for result in load_incremental(dsn, options, args.slices):
+            table = result.pop('table')
+            print('{}: {}.'.format(table, ', '.join('{} {}'.format(value, key) for key, value in result.items())))
+        conn.close()
+        return
+
+    profiler = QueryProfiler(cur, conn) if args.profile else None
+
+    start_ms = int(time.time() * 1000)
+    if args.staging == 'manifest':
+        for result in load_staging_tables_parallel(dsn, options, args.slices):
+            print('{table}: {files} files, {bytes} bytes over {slices} slices in {seconds}s.'.format(**result))
+    else:
+        load_staging_tables(cur, conn, profiler)
+
+    if args.inserts == 'dag':
+        for result in run_dag(insert_table_steps, functools.partial(psycopg2.connect, dsn), args.workers):
+            print('{table}: {rows} rows in {seconds}s.'.format(**result))
+    else:
+        insert_tables(cur, conn, profiler)
+    record_full_load(cur, conn, start_ms)
+    if profiler is not None:
+        profiler.write_report(args.profile)
 
     conn.close()
 
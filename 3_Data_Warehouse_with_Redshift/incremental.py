@@ -0,0 +1,130 @@
+import re
+import time
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+from sql_queries import config, incremental_merge_steps, staging_events_max_ts, staging_sources, \
+    staging_truncate_queries, watermark_select, watermark_table_create, watermark_update
+from staging_copy import list_s3_objects, stage_source, upload_s3_object
+
+
+# day of a daily log file, e.g. log_data/2018/11/2018-11-01-events.json
+DAY_PATTERN = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
+
+
+def get_watermarks(cur):
+    """Return the watermark of each source, log_data and song_data, -1 when it was never loaded."""
+    cur.execute(watermark_select)
+    watermarks = {'log_data': -1, 'song_data': -1}
+    watermarks.update(dict(cur.fetchall()))
+
+    return watermarks
+
+
+def set_watermark(cur, source, watermark):
+    """Store the watermark of a source, in the transaction of the data it refers to."""
+    cur.execute(watermark_update, {'source': source, 'watermark': watermark})
+
+
+def select_new_events(objects, watermark):
+    """
+    Keep the log files of the day of the watermark and of the days after it, the events
+    already loaded on that day are skipped later by their ts. Files without a day in
+    their name are always kept.
+    """
+    if watermark < 0:
+        return objects
+
+    last_day = datetime.fromtimestamp(watermark / 1000, timezone.utc).strftime('%Y-%m-%d')
+    new_objects = []
+    for obj in objects:
+        day = DAY_PATTERN.search(obj[0].rsplit('/', 1)[-1])
+        if day is None or '-'.join(day.groups()) >= last_day:
+            new_objects.append(obj)
+
+    return new_objects
+
+
+def select_new_songs(objects, watermark):
+    """Keep the song files modified after the watermark."""
+    return [obj for obj in objects if obj[2] > watermark]
+
+
+def load_incremental(dsn, options = '', slices = None, list_objects = list_s3_objects,
+                     upload = upload_s3_object, connect = psycopg2.connect):
+    """
+    Load only what arrived since the last run: the new log partitions and song files are
+    copied to the emptied staging tables, the dimensions are merged with delete+insert, the
+    songplays and time records of the events after the watermark are appended, and the new
+    watermarks are stored in the same transaction as the merges.
+
+    Args:
+        dsn: connection string of the cluster;
+        options: extra COPY options from staging_copy.copy_options();
+        slices: number of slices of the cluster, None to ask the cluster, see staging_copy.check_file_count();
+        list_objects, upload, connect: see staging_copy.stage_source().
+
+    Returns:
+        results: list with the staging result of each source and the rows inserted and
+        seconds of the merge of each table.
+    """
+    conn = connect(dsn)
+    try:
+        cur = conn.cursor()
+        cur.execute(watermark_table_create)
+        conn.commit()
+        watermarks = get_watermarks(cur)
+
+        for query in staging_truncate_queries:
+            cur.execute(query)
+            conn.commit()
+
+        # the song files listed are kept to move the watermark to the last one copied
+        song_objects = []
+
+        def list_new_events(url):
+            return select_new_events(list_objects(url), watermarks['log_data'])
+
+        def list_new_songs(url):
+            song_objects.extend(select_new_songs(list_objects(url), watermarks['song_data']))
+            return song_objects
+
+        select_funcs = {'staging_events_table': list_new_events, 'staging_songs_table': list_new_songs}
+        manifest_prefix = config.get('S3', 'MANIFEST_PREFIX')
+        with ThreadPoolExecutor(len(staging_sources)) as executor:
+            futures = [executor.submit(stage_source, dsn, table, source_url, format_clause, manifest_prefix,
+                                       options, slices, select_funcs[table], upload, connect)
+                       for table, source_url, format_clause in staging_sources]
+            results = [future.result() for future in futures]
+
+        for table, query in incremental_merge_steps:
+            start = time.perf_counter()
+            cur.execute(query, {'watermark': watermarks['log_data']})
+            results.append({'table': table, 'rows': cur.rowcount, 'seconds': round(time.perf_counter() - start, 3)})
+
+        cur.execute(staging_events_max_ts)
+        max_ts = cur.fetchone()[0]
+        if max_ts is not None and max_ts > watermarks['log_data']:
+            set_watermark(cur, 'log_data', max_ts)
+        if song_objects:
+            set_watermark(cur, 'song_data', max(obj[2] for obj in song_objects))
+        conn.commit()
+    finally:
+        conn.close()
+
+    return results
+
+
+def record_full_load(cur, conn, songs_watermark):
+    """
+    Store the watermarks after a full rebuild, so the next incremental run starts from it:
+    the greatest ts in staging for the events, and the time the run started for the songs.
+    """
+    cur.execute(watermark_table_create)
+    cur.execute(staging_events_max_ts)
+    max_ts = cur.fetchone()[0]
+    if max_ts is not None:
+        set_watermark(cur, 'log_data', max_ts)
+    set_watermark(cur, 'song_data', songs_watermark)
+    conn.commit()
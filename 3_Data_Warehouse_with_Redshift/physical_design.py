@@ -0,0 +1,89 @@
+import re
+import json
+
+
+# distribution, sort keys and column encodings of each table. The staging tables are
+# sorted on the columns of the songplays join. The events are spread evenly, as song is
+# NULL for every event but NextSong and would put them all on one slice; the join then
+# moves only the NextSong events to the slices of their songs. The fact table is 
+# co-located with time_table on start_time.
+# Tables or attributes left out keep what their CREATE TABLE says (e.g. no encoding, AUTO).
+PHYSICAL_DESIGN = {
+    'staging_events_table': {'diststyle': 'even', 'sortkey': ['song', 'artist', 'length']},
+    'staging_songs_table': {'distkey': 'title', 'sortkey': ['title', 'artist_name', 'duration']},
+    'songplay_table': {'distkey': 'start_time', 'sortkey': ['start_time'],
+                       'encode': {'level': 'bytedict', 'location': 'zstd', 'user_agent': 'zstd'}},
+    'user_table': {'diststyle': 'all', 'sortkey': ['user_id'],
+                   'encode': {'gender': 'bytedict', 'level': 'bytedict'}},
+    'song_table': {'diststyle': 'all', 'sortkey': ['title', 'duration'],
+                   'encode': {'artist_id': 'zstd', 'year': 'az64'}},
+    'artist_table': {'diststyle': 'all', 'sortkey': ['artist_id'],
+                     'encode': {'name': 'zstd', 'location': 'zstd'}},
+    'time_table': {'distkey': 'start_time', 'sortkey': ['start_time'],
+                   'encode': {column: 'az64' for column in ['hour', 'day', 'week', 'month', 'year', 'weekday']}},
+}
+
+CREATE_PATTERN = re.compile(r'CREATE TABLE (?:IF NOT EXISTS )?(\w+)\s*\(', re.IGNORECASE)
+INLINE_KEYS = re.compile(r'\s+(?:distkey|sortkey)\b|\s*\bdiststyle\s+\w+', re.IGNORECASE)
+
+
+def load_design(path = None):
+    """Return PHYSICAL_DESIGN with the tables of the json spec at path (if any) replacing their entries."""
+    design = dict(PHYSICAL_DESIGN)
+    if path:
+        with open(path) as f:
+            design.update(json.load(f))
+
+    return design
+
+
+def table_attributes(spec):
+    """Return the DISTSTYLE, DISTKEY and SORTKEY clauses of a table spec."""
+    attributes = []
+    if 'distkey' in spec:
+        attributes.append('DISTSTYLE KEY DISTKEY ({})'.format(spec['distkey']))
+    elif 'diststyle' in spec:
+        attributes.append('DISTSTYLE {}'.format(spec['diststyle'].upper()))
+    if spec.get('sortkey'):
+        attributes.append('COMPOUND SORTKEY ({})'.format(', '.join(spec['sortkey'])))
+
+    return '\n'.join(attributes)
+
+
+def apply_design(query, design = PHYSICAL_DESIGN):
+    """
+    Rewrite a CREATE TABLE of sql_queries.py with the physical design of its table: the
+    inline distkey, sortkey and diststyle are replaced by the ones of the spec and the
+    encodings are added to the columns. Tables without a spec are returned unchanged.
+
+    Args:
+        query: CREATE TABLE with one column per line, separated by commas;
+        design: dict with the spec of each table, see PHYSICAL_DESIGN.
+
+    Returns:
+        query: the CREATE TABLE with the design applied.
+    """
+    match = CREATE_PATTERN.search(query)
+    if match is None or match.group(1) not in design:
+        return query
+    spec = design[match.group(1)]
+
+    body = INLINE_KEYS.sub('', query[match.end():]).rstrip().rstrip(';').rstrip().lstrip('\n')
+    if not body.endswith(')'):
+        raise ValueError('unexpected end of the CREATE TABLE of {}'.format(match.group(1)))
+
+    encode = spec.get('encode', {})
+    columns = []
+    for column in re.split(r',[ \t]*\n', body[:-1]):
+        column = column.rstrip()
+        name = column.split()[0]
+        if name in encode:
+            column += ' ENCODE {}'.format(encode[name])
+        columns.append(column)
+
+    unknown = (set(encode) | set(spec.get('sortkey', [])) | {spec.get('distkey')}) - \
+        {column.split()[0] for column in columns} - {None}
+    if unknown:
+        raise ValueError('columns {} of the design are not in {}'.format(sorted(unknown), match.group(1)))
+
+    return '{}\n{})\n{};\n'.format(query[:match.end()], ',\n'.join(columns), table_attributes(spec))
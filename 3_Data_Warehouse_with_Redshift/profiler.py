@@ -0,0 +1,154 @@
+import re
+import sys
+import json
+import time
+import difflib
+from datetime import datetime, timezone
+
+
+STATEMENT_PATTERN = re.compile(r'\b(COPY|INSERT INTO)\s+(\w+)', re.IGNORECASE)
+
+# numbers of the plans that change from run to run, removed before comparing them
+PLAN_NUMBERS = re.compile(r'(cost|rows|width|time|loops)=[\d.]+(\.\.[\d.]+)?')
+
+query_summary_select = ("""
+SELECT stm, seg, step, label, rows, bytes, maxtime, is_diskbased
+FROM svl_query_summary
+WHERE query = %s
+ORDER BY stm, seg, step;
+""")
+
+load_errors_select = ("""
+SELECT TRIM(filename), line_number, TRIM(colname), TRIM(err_reason), TRIM(raw_field_value)
+FROM stl_load_errors
+WHERE query = %s
+ORDER BY line_number;
+""")
+
+
+def statement_name(query):
+    """Name a statement after its target table, e.g. 'INSERT INTO user_table' or 'COPY staging_events_table'."""
+    match = STATEMENT_PATTERN.search(query)
+    if match is None:
+        return query.split()[0]
+
+    return '{} {}'.format(match.group(1).upper(), match.group(2))
+
+
+class QueryProfiler:
+    """
+    Run the statements of the ETL recording their plan, time and rows. On Redshift
+    the plan comes from EXPLAIN before the statement, and SVL_QUERY_SUMMARY and
+    STL_LOAD_ERRORS of the statement are read after it. On Postgres, used as a local
+    stand-in, EXPLAIN ANALYZE runs inside a savepoint that is rolled back before the
+    statement, so the plan has the actual rows and time of each node.
+    """
+
+    def __init__(self, cur, conn):
+        cur.execute("SELECT version();")
+        self.redshift = 'redshift' in cur.fetchone()[0].lower()
+        conn.commit()
+        self.statements = []
+
+    def explain(self, cur, query):
+        """Return the lines of the plan of query, None for the statements that cannot be explained (COPY)."""
+        if query.strip().upper().startswith('COPY'):
+            return None
+
+        if self.redshift:
+            cur.execute('EXPLAIN ' + query)
+            return [row[0] for row in cur.fetchall()]
+
+        cur.execute('SAVEPOINT profile;')
+        try:
+            cur.execute('EXPLAIN ANALYZE ' + query)
+            return [row[0] for row in cur.fetchall()]
+        finally:
+            cur.execute('ROLLBACK TO SAVEPOINT profile;')
+
+    def system_tables(self, cur, query):
+        """Read the steps of the statement just run and the errors of its COPY from the Redshift system tables."""
+        is_copy = query.strip().upper().startswith('COPY')
+        cur.execute('SELECT pg_last_copy_id();' if is_copy else 'SELECT pg_last_query_id();')
+        query_id = cur.fetchone()[0]
+
+        cur.execute(query_summary_select, (query_id,))
+        columns = [column[0] for column in cur.description]
+        summary = [dict(zip(columns, row)) for row in cur.fetchall()]
+
+        load_errors = []
+        if is_copy:
+            cur.execute(load_errors_select, (query_id,))
+            load_errors = [dict(zip(['file', 'line', 'column', 'reason', 'value'], row)) for row in cur.fetchall()]
+
+        return query_id, summary, load_errors
+
+    def execute(self, cur, query):
+        """Run query with cur recording its profile, the caller commits as before."""
+        plan = self.explain(cur, query)
+
+        start = time.perf_counter()
+        cur.execute(query)
+        seconds = time.perf_counter() - start
+        rows = cur.rowcount
+
+        statement = {'name': statement_name(query), 'seconds': round(seconds, 3), 'rows': rows, 'plan': plan}
+        if self.redshift:
+            statement['query_id'], statement['summary'], statement['load_errors'] = self.system_tables(cur, query)
+        self.statements.append(statement)
+
+    def write_report(self, path):
+        """Write the profile of the statements run to a json file."""
+        report = {'created_at': datetime.now(timezone.utc).isoformat(), 'redshift': self.redshift,
+                  'statements': self.statements}
+        with open(path, 'w') as f:
+            json.dump(report, f, indent = 2, default = str)
+
+
+def normalize_plan(plan):
+    """Remove the costs, rows and times of a plan, keeping its shape, to compare it between runs."""
+    return [PLAN_NUMBERS.sub(r'\1=?', line).rstrip() for line in plan or []]
+
+
+def diff_reports(old_report, new_report):
+    """
+    Compare two profiler reports statement by statement.
+
+    Returns:
+        lines: text lines with the time of each statement in both runs and the unified diff
+        of its plan when the plan changed.
+    """
+    old_statements = {statement['name']: statement for statement in old_report['statements']}
+
+    lines = []
+    for statement in new_report['statements']:
+        name = statement['name']
+        old = old_statements.get(name)
+        if old is None:
+            lines.append('{}: {}s, not in the old report.'.format(name, statement['seconds']))
+            continue
+
+        ratio = '{:.2f}x'.format(statement['seconds'] / old['seconds']) if old['seconds'] else 'n/a'
+        lines.append('{}: {}s -> {}s ({}), {} -> {} rows.'.format(
+            name, old['seconds'], statement['seconds'], ratio, old['rows'], statement['rows']))
+        lines.extend('    ' + line for line in difflib.unified_diff(
+            normalize_plan(old['plan']), normalize_plan(statement['plan']), 'old plan', 'new plan', lineterm = ''))
+
+    return lines
+
+
+def main():
+    """Print the differences between two profiler reports: python profiler.py old.json new.json"""
+    if len(sys.argv) != 3:
+        sys.exit(main.__doc__)
+
+    with open(sys.argv[1]) as f:
+        old_report = json.load(f)
+    with open(sys.argv[2]) as f:
+        new_report = json.load(f)
+
+    print('\n'.join(diff_reports(old_report, new_report)))
+
+
+if __name__ == "__main__":
+    main()
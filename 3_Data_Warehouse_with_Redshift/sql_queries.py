@@ -1,4 +1,5 @@
 import configparser
+from physical_design import apply_design, load_design
 
 
 # CONFIG
@@ -133,6 +134,26 @@ staging_songs_copy = ("""
     config.get('IAM_ROLE', 'ARN')
 )
 
+# STAGING WITH MANIFESTS
+
+# source prefix and format of each staging table, the COPY reads the files listed in a manifest
+staging_sources = [
+    ('staging_events_table', config.get('S3', 'LOG_DATA'), "JSON {}".format(config.get('S3', 'LOG_JSONPATH'))),
+    ('staging_songs_table', config.get('S3', 'SONG_DATA'), "FORMAT AS JSON 'auto'")
+]
+
+staging_copy_manifest = ("""
+    COPY {}
+    FROM '{}'
+    IAM_ROLE {}
+    {}
+    MANIFEST
+    {};
+""")
+
+# number of slices of the cluster, each one loads whole files of a COPY
+slice_count = "SELECT COUNT(*) FROM stv_slices;"
+
 # FINAL TABLES 
 
 # got the timestamp trick from here: https://stackoverflow.com/questions/39815425/how-to-convert-epoch-to-datetime-redshift
@@ -151,38 +172,52 @@ songplay_table_insert = ("""
     JOIN staging_songs_table s ON (e.song = s.title AND e.artist = s.artist_name AND e.length = s.duration)                            
 """)
 
+# the dimensions keep one row per key: the latest record of each user (greatest ts), and
+# for songs and artists, which have no load time, the record of the latest song (greatest
+# year). A DISTINCT on the whole row would keep a user once per level it ever had.
 user_table_insert = ("""
 INSERT INTO user_table (user_id, first_name, last_name, gender, level)
-SELECT DISTINCT (user_id),
+SELECT user_id,
        first_name,
        last_name,
        gender,
        level
-FROM staging_events_table; 
+FROM (SELECT user_id, first_name, last_name, gender, level,
+             ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY ts DESC) AS row_number
+      FROM staging_events_table) AS latest
+WHERE row_number = 1;
 """)
 
 song_table_insert = ("""
 INSERT INTO song_table (song_id, title, artist_id, year, duration)
-SELECT DISTINCT (song_id),
+SELECT song_id,
        title,
        artist_id,
-       year, 
+       year,
        duration
-FROM staging_songs_table
+FROM (SELECT song_id, title, artist_id, year, duration,
+             ROW_NUMBER() OVER (PARTITION BY song_id ORDER BY year DESC, duration DESC) AS row_number
+      FROM staging_songs_table) AS latest
+WHERE row_number = 1;
 """)
 
 artist_table_insert = ("""
 INSERT INTO artist_table (artist_id, name, location, latitude, longitude)
-SELECT DISTINCT (artist_id),
+SELECT artist_id,
        artist_name,
        artist_location,
        artist_latitude,
        artist_longitude
-FROM staging_songs_table
+FROM (SELECT artist_id, artist_name, artist_location, artist_latitude, artist_longitude,
+             ROW_NUMBER() OVER (PARTITION BY artist_id ORDER BY year DESC, song_id DESC) AS row_number
+      FROM staging_songs_table) AS latest
+WHERE row_number = 1;
 """)
 
 # once this table has all its values based on start_time, we can avoid another conversion
 # by pulling the data not from staging_events_table but songplay_table.
+# the timestamps are deduplicated before extracting the attributes and the ones already
+# in time_table are skipped, so the table gets one row per start_time.
 time_table_insert = ("""
 INSERT INTO time_table (start_time, hour, day, week, month, year, weekday)
 SELECT start_time,
@@ -192,19 +227,115 @@ SELECT start_time,
        EXTRACT(month FROM start_time),
        EXTRACT(year FROM start_time),
        EXTRACT(weekday FROM start_time)
-FROM songplay_table
+FROM (SELECT DISTINCT start_time FROM songplay_table) AS new_times
+WHERE NOT EXISTS (SELECT 1 FROM time_table t WHERE t.start_time = new_times.start_time)
+""")
+
+# INCREMENTAL LOADS
+
+# high-watermark of each source: the greatest ts of the events loaded and the
+# last modification (epoch ms) of the song files loaded
+watermark_table_drop = "DROP TABLE IF EXISTS etl_watermark;"
+
+watermark_table_create = ("""
+CREATE TABLE IF NOT EXISTS etl_watermark (
+    source          VARCHAR(32)    NOT NULL PRIMARY KEY,
+    watermark       BIGINT         NOT NULL,
+    updated_at      TIMESTAMP      NOT NULL);
+""")
+
+watermark_select = "SELECT source, watermark FROM etl_watermark;"
+
+watermark_update = ("""
+DELETE FROM etl_watermark WHERE source = %(source)s;
+INSERT INTO etl_watermark (source, watermark, updated_at) VALUES (%(source)s, %(watermark)s, GETDATE());
+""")
+
+staging_events_max_ts = "SELECT MAX(ts) FROM staging_events_table;"
+
+staging_events_table_truncate = "TRUNCATE staging_events_table;"
+staging_songs_table_truncate = "TRUNCATE staging_songs_table;"
+
+# the staging tables hold only the new files, the dimensions replace the rows of the keys
+# found in them (delete+insert) and the facts are appended for the events after the watermark
+artist_table_merge = ("""
+DELETE FROM artist_table
+USING staging_songs_table s
+WHERE artist_table.artist_id = s.artist_id;
+""") + artist_table_insert
+
+song_table_merge = ("""
+DELETE FROM song_table
+USING staging_songs_table s
+WHERE song_table.song_id = s.song_id;
+""") + song_table_insert
+
+user_table_merge = ("""
+DELETE FROM user_table
+USING staging_events_table e
+WHERE user_table.user_id = e.user_id AND e.ts > %(watermark)s;
+
+INSERT INTO user_table (user_id, first_name, last_name, gender, level)
+SELECT user_id,
+       first_name,
+       last_name,
+       gender,
+       level
+FROM (SELECT user_id, first_name, last_name, gender, level,
+             ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY ts DESC) AS row_number
+      FROM staging_events_table
+      WHERE ts > %(watermark)s) AS latest
+WHERE row_number = 1;
+""")
+
+# the new events are matched with all the songs loaded so far, not only the new ones in staging
+songplay_table_append = ("""
+    INSERT INTO songplay_table (start_time, user_id, level, song_id, artist_id, session_id, location, user_agent)
+    SELECT TIMESTAMP 'epoch' + (e.ts / 1000) * interval '1 second',
+           e.user_id,
+           e.level,
+           s.song_id,
+           s.artist_id,
+           e.session_id,
+           e.location,
+           e.user_agent
+    FROM staging_events_table e
+    JOIN song_table s ON (e.song = s.title AND e.length = s.duration)
+    JOIN artist_table a ON (s.artist_id = a.artist_id AND e.artist = a.name)
+    WHERE e.ts > %(watermark)s;
+""")
+
+# start_time is truncated to the second, so a new songplay may share the second of the
+# watermark: that second is taken again, and NOT EXISTS skips the times already stored
+time_table_append = ("""
+INSERT INTO time_table (start_time, hour, day, week, month, year, weekday)
+SELECT start_time,
+       EXTRACT(hour FROM start_time),
+       EXTRACT(day FROM start_time),
+       EXTRACT(week FROM start_time),
+       EXTRACT(month FROM start_time),
+       EXTRACT(year FROM start_time),
+       EXTRACT(weekday FROM start_time)
+FROM (SELECT DISTINCT start_time FROM songplay_table
+      WHERE start_time >= TIMESTAMP 'epoch' + (%(watermark)s / 1000) * interval '1 second') AS new_times
+WHERE NOT EXISTS (SELECT 1 FROM time_table t WHERE t.start_time = new_times.start_time);
 """)
 
 
 # QUERY LISTS
 
-create_table_queries = [staging_events_table_create,
+# the distribution, sort keys and encodings of the tables come from the physical design,
+# PHYSICAL_DESIGN of physical_design.py updated with the json spec of [DESIGN] SPEC, if any
+physical_design = load_design(config.get('DESIGN', 'SPEC', fallback = None))
+
+create_table_queries = [apply_design(query, physical_design) for query in [staging_events_table_create,
                         staging_songs_table_create, 
                         songplay_table_create, 
                         user_table_create, 
                         song_table_create, 
                         artist_table_create, 
-                        time_table_create]
+                        time_table_create,
+                        watermark_table_create]]
 
 drop_table_queries = [staging_events_table_drop, 
                      staging_songs_table_drop, 
@@ -212,7 +343,8 @@ drop_table_queries = [staging_events_table_drop,
                      user_table_drop, 
                      song_table_drop, 
                      artist_table_drop, 
-                     time_table_drop]
+                     time_table_drop,
+                     watermark_table_drop]
 
 copy_table_queries = [staging_events_copy, staging_songs_copy]
 
@@ -221,3 +353,19 @@ insert_table_queries = [songplay_table_insert,
                         song_table_insert, 
                         artist_table_insert,
                         time_table_insert]
+
+# insert queries by table with the tables they read from, to run the independent ones concurrently
+insert_table_steps = [('songplay_table', songplay_table_insert, []),
+                      ('user_table', user_table_insert, []),
+                      ('song_table', song_table_insert, []),
+                      ('artist_table', artist_table_insert, []),
+                      ('time_table', time_table_insert, ['songplay_table'])]
+
+staging_truncate_queries = [staging_events_table_truncate, staging_songs_table_truncate]
+
+# merge query of each table, the dimensions first as the new songplays are matched with song_table and artist_table
+incremental_merge_steps = [('artist_table', artist_table_merge),
+                           ('song_table', song_table_merge),
+                           ('user_table', user_table_merge),
+                           ('songplay_table', songplay_table_append),
+                           ('time_table', time_table_append)]
@@ -0,0 +1,167 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+from sql_queries import config, slice_count, staging_copy_manifest, staging_sources
+
+
+def parse_s3_url(url):
+    """Split an s3://bucket/prefix url, as written in dwh.cfg (quoted or not), into bucket and prefix."""
+    url = url.strip().strip("'\"")
+    bucket, _, prefix = url[len('s3://'):].partition('/')
+
+    return bucket, prefix
+
+
+def list_s3_objects(url):
+    """
+    List the files under an S3 prefix.
+
+    Args:
+        url: s3://bucket/prefix of the source data.
+
+    Returns:
+        objects: list of tuples (url, size in bytes, last modified in epoch milliseconds),
+        without the folder markers.
+    """
+    import boto3
+
+    bucket, prefix = parse_s3_url(url)
+    paginator = boto3.client('s3').get_paginator('list_objects_v2')
+
+    objects = []
+    for page in paginator.paginate(Bucket = bucket, Prefix = prefix):
+        for item in page.get('Contents', []):
+            if not item['Key'].endswith('/'):
+                objects.append(('s3://{}/{}'.format(bucket, item['Key']), item['Size'],
+                                int(item['LastModified'].timestamp() * 1000)))
+
+    return objects
+
+
+def upload_s3_object(url, body):
+    """Write body to the S3 url."""
+    import boto3
+
+    bucket, key = parse_s3_url(url)
+    boto3.client('s3').put_object(Bucket = bucket, Key = key, Body = body.encode('utf8'))
+
+
+def build_manifest(objects):
+    """
+    Build the COPY manifest of the files. Redshift assigns the files of a manifest to
+    the slices itself, whatever their order, so the entries just follow the listing.
+
+    Returns:
+        manifest: dict with the mandatory entries and their content_length.
+    """
+    return {'entries': [{'url': url, 'mandatory': True, 'meta': {'content_length': size}}
+                        for url, size, *_ in objects]}
+
+
+def copy_options(gzip = False, compupdate = None, statupdate = None):
+    """Return the extra options of the COPY, compupdate and statupdate being 'ON', 'OFF' or None to leave them out."""
+    options = []
+    if gzip:
+        options.append('GZIP')
+    if compupdate:
+        options.append('COMPUPDATE {}'.format(compupdate))
+    if statupdate:
+        options.append('STATUPDATE {}'.format(statupdate))
+
+    return ' '.join(options)
+
+
+def get_slice_count(cur, conn, default = 1):
+    """Count the slices of the cluster, returning default when stv_slices can not be read."""
+    try:
+        cur.execute(slice_count)
+        return cur.fetchone()[0] or default
+    except psycopg2.Error:
+        conn.rollback()
+        return default
+
+
+def check_file_count(table, files, slices):
+    """
+    Warn when the files of a COPY can not keep every slice busy to the end: each slice
+    loads one file at a time, so fewer files than slices leave some idle, and a count
+    that is not a multiple of the slices leaves some idle during the last round.
+
+    Returns:
+        warning: text of the warning, or None when the files split evenly.
+    """
+    if not slices or files % slices == 0:
+        return None
+
+    warning = '{}: {} files over {} slices, {} slices idle in the last round of the COPY'.format(
+        table, files, slices, slices - files % slices)
+    print('WARNING {}'.format(warning))
+
+    return warning
+
+
+def stage_source(dsn, table, source_url, format_clause, manifest_prefix, options = '', slices = None,
+                 list_objects = list_s3_objects, upload = upload_s3_object, connect = psycopg2.connect):
+    """
+    List the files of a source, write their manifest and COPY them into the staging
+    table on a connection of its own. Nothing is copied when there are no files.
+
+    Args:
+        dsn: connection string of the cluster;
+        table: staging table;
+        source_url: s3 prefix of the source data;
+        format_clause: format of the files, e.g. "FORMAT AS JSON 'auto'";
+        manifest_prefix: s3 folder where the manifest is written;
+        options: extra COPY options from copy_options();
+        slices: number of slices of the cluster, None to ask the cluster, to warn when the
+        files do not split evenly over them (see check_file_count());
+        list_objects, upload, connect: functions listing S3, writing to S3 and connecting
+        to the cluster.
+
+    Returns:
+        result: dict with the table, the number of files and bytes, the slices, the warning of
+        check_file_count() and the seconds spent.
+    """
+    start = time.perf_counter()
+    objects = list_objects(source_url)
+    if not objects:
+        return {'table': table, 'files': 0, 'bytes': 0, 'slices': slices, 'warning': None,
+                'seconds': round(time.perf_counter() - start, 3)}
+
+    conn = connect(dsn)
+    try:
+        cur = conn.cursor()
+        if slices is None:
+            slices = get_slice_count(cur, conn)
+        warning = check_file_count(table, len(objects), slices)
+
+        manifest_url = '{}/{}.manifest'.format(manifest_prefix.strip().strip("'\"").rstrip('/'), table)
+        upload(manifest_url, json.dumps(build_manifest(objects)))
+
+        cur.execute(staging_copy_manifest.format(table, manifest_url, config.get('IAM_ROLE', 'ARN'),
+                                                 format_clause, options))
+        conn.commit()
+    finally:
+        conn.close()
+
+    return {'table': table, 'files': len(objects), 'bytes': sum(item[1] for item in objects),
+            'slices': slices, 'warning': warning, 'seconds': round(time.perf_counter() - start, 3)}
+
+
+def load_staging_tables_parallel(dsn, options = '', slices = None, sources = staging_sources,
+                                 list_objects = list_s3_objects, upload = upload_s3_object, connect = psycopg2.connect):
+    """
+    Stage all the sources at the same time, each one listed, written to a manifest
+    and copied on its own connection. See stage_source() for the arguments.
+
+    Returns:
+        results: list with the result of each source, in the order of sources.
+    """
+    manifest_prefix = config.get('S3', 'MANIFEST_PREFIX')
+    with ThreadPoolExecutor(len(sources)) as executor:
+        futures = [executor.submit(stage_source, dsn, table, source_url, format_clause, manifest_prefix,
+                                   options, slices, list_objects, upload, connect)
+                   for table, source_url, format_clause in sources]
+        return [future.result() for future in futures]
@@ -0,0 +1,133 @@
+import os
+import math
+import argparse
+from datetime import datetime, timezone
+from pyspark.sql import SparkSession
+from pyspark.sql.types import StructType, StructField, StringType, LongType
+
+from song_source import SONG_SCHEMA, delete_path
+
+
+# folder of the compacted set listing the song files already compacted and their batch,
+# hidden from the readers of the compacted set by its leading underscore
+MANIFEST_FOLDER = '_compacted_files'
+
+MANIFEST_SCHEMA = StructType([StructField('path', StringType()),
+                              StructField('size', LongType()),
+                              StructField('modified', LongType()),
+                              StructField('batch', StringType())
+                              ])
+
+
+def get_file_system(spark, path):
+    """Function to return the Hadoop file system of a path (local, HDFS or S3) and the path as a Hadoop Path."""
+    jvm_path = spark._jvm.org.apache.hadoop.fs.Path(path)
+
+    return jvm_path.getFileSystem(spark._jsc.hadoopConfiguration()), jvm_path
+
+
+def list_json_files(spark, path):
+    """Function to list all the json files under path.
+
+    Returns:
+        files: list of tuples (path, size in bytes, last modified in epoch milliseconds).
+    """
+    fs, jvm_path = get_file_system(spark, path)
+    if not fs.exists(jvm_path):
+        return []
+
+    files = []
+    iterator = fs.listFiles(jvm_path, True)
+    while iterator.hasNext():
+        status = iterator.next()
+        path = status.getPath().toString()
+        if path.endswith('.json'):
+            files.append((path, status.getLen(), status.getModificationTime()))
+
+    return files
+
+
+def read_manifest(spark, compacted_path):
+    """Function to read the files already compacted.
+
+    Returns:
+        compacted: dict with the batch of each path compacted.
+    """
+    manifest_path = os.path.join(compacted_path, MANIFEST_FOLDER)
+    fs, jvm_path = get_file_system(spark, manifest_path)
+    if not fs.exists(jvm_path):
+        return {}
+
+    return dict(spark.read.json(manifest_path, schema = MANIFEST_SCHEMA).select('path', 'batch').collect())
+
+
+def remove_unrecorded_batches(spark, compacted_path, batches):
+    """Function to delete the batch folders missing from the manifest, left by a run that
+    failed between writing its batch and recording it, so their songs are compacted again.
+    """
+    fs, jvm_path = get_file_system(spark, compacted_path)
+    if not fs.exists(jvm_path):
+        return
+
+    for status in fs.listStatus(jvm_path):
+        name = status.getPath().getName()
+        if status.isDirectory() and name.startswith('batch=') and name[len('batch='):] not in batches:
+            delete_path(spark, status.getPath().toString())
+
+
+def compact_song_data(spark, input_data, compacted_path, target_mb = 128):
+    """Function to roll the small song json files that were not compacted yet into a
+    new batch of Parquet files of about target_mb of json each, under
+    compacted_path/batch=<time of the run>, and record them in the manifest. The song
+    files are never changed after written, so only new paths are compacted.
+
+    Args:
+        spark: SparkSession to handle data using Spark;
+        input_data: general path where the data resides;
+        compacted_path: folder of the compacted set;
+        target_mb: megabytes of json rolled into each Parquet file.
+
+    Returns:
+        result: dict with the batch, the number of new files and bytes and the files written.
+    """
+    compacted = read_manifest(spark, compacted_path)
+    remove_unrecorded_batches(spark, compacted_path, set(compacted.values()))
+
+    new_files = [item for item in list_json_files(spark, os.path.join(input_data, 'song_data'))
+                 if item[0] not in compacted]
+    if not new_files:
+        return {'batch': None, 'files': 0, 'bytes': 0, 'output_files': 0}
+
+    batch = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+    new_bytes = sum(item[1] for item in new_files)
+    output_files = max(1, math.ceil(new_bytes / (target_mb * 1024 * 1024)))
+
+    df = spark.read.json([item[0] for item in new_files], schema = SONG_SCHEMA)
+    df.coalesce(output_files).write.parquet(os.path.join(compacted_path, 'batch={}'.format(batch)),
+                                            mode = 'overwrite')
+
+    # the batch is only recorded once its files are written
+    manifest = spark.createDataFrame([(path, size, modified, batch) for path, size, modified in new_files],
+                                     schema = MANIFEST_SCHEMA)
+    manifest.coalesce(1).write.json(os.path.join(compacted_path, MANIFEST_FOLDER), mode = 'append')
+
+    return {'batch': batch, 'files': len(new_files), 'bytes': new_bytes, 'output_files': output_files}
+
+
+def main():
+    """Function to compact the new song files of input_data into the compacted set, to be
+    run on its own (e.g. on a schedule) before the ETL reads the compacted set.
+    """
+    parser = argparse.ArgumentParser(description = 'Compact the new song json files into Parquet.')
+    parser.add_argument('input_data', help = 'general path where the data resides, with the song_data folder')
+    parser.add_argument('compacted_path', help = 'folder of the compacted set')
+    parser.add_argument('--target-mb', type = int, default = 128, help = 'megabytes of json rolled into each file')
+    args = parser.parse_args()
+
+    spark = SparkSession.builder.appName('compact_songs').getOrCreate()
+    print(compact_song_data(spark, args.input_data, args.compacted_path, args.target_mb))
+    spark.stop()
+
+
+if __name__ == "__main__":
+    main()
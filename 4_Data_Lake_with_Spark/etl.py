@@ -0,0 +1,382 @@
+try:
+    # findspark locates a local Spark installation, the cluster has pyspark on its path
+    import findspark
+    findspark.init()
+except ImportError:
+    pass
+
+import argparse
+import configparser
+from datetime import datetime
+import os
+from pyspark.sql import SparkSession
+from pyspark.sql.functions import udf, col
+from pyspark.sql.functions import year, month, dayofmonth, hour, weekofyear, date_format
+import pyspark.sql.functions as F
+from pyspark.sql.types import StructType, StructField, IntegerType,\
+        StringType, DateType, FloatType, DoubleType, LongType
+from table_io import OUTPUT_FORMATS, write_table
+from songplay_ids import ID_STRATEGIES, add_songplay_id
+from join_strategy import JOIN_STRATEGIES, join_config, join_songs
+from compact_songs import compact_song_data
+from incremental_lake import latest_rows, read_checkpoint, save_table, select_new_log_files, write_checkpoint
+from job_metrics import JobMetrics, track_table
+from time_dimension import TIME_METHODS, build_time_table
+from song_source import STORAGE_LEVELS, load_song_data, read_song_data, release_song_data
+
+PROFILES = ['local', 'cluster']
+
+# schema of the log files, so they are not read one more time to infer it
+LOG_SCHEMA = StructType([StructField('artist', StringType()),
+                         StructField('auth', StringType()),
+                         StructField('firstName', StringType()),
+                         StructField('gender', StringType()),
+                         StructField('itemInSession', LongType()),
+                         StructField('lastName', StringType()),
+                         StructField('length', DoubleType()),
+                         StructField('level', StringType()),
+                         StructField('location', StringType()),
+                         StructField('method', StringType()),
+                         StructField('page', StringType()),
+                         StructField('registration', DoubleType()),
+                         StructField('sessionId', LongType()),
+                         StructField('song', StringType()),
+                         StructField('status', LongType()),
+                         StructField('ts', LongType()),
+                         StructField('userAgent', StringType()),
+                         StructField('userId', StringType()),
+                         ])
+
+
+def load_profile(profile, path = 'dl.cfg'):
+    """Function to read a profile of dl.cfg, local or cluster, and export the AWS
+    credentials of its [AWS] section when they are filled.
+
+    Args:
+        profile: section of dl.cfg with the paths and the Spark settings of the profile;
+        path: path of the config file.
+
+    Returns:
+        input_data: general path where the data resides;
+        output_data: folder's path or bucket where the tables are stored;
+        settings: dict with the Spark settings of the profile (the keys starting with spark.).
+    """
+    config = configparser.ConfigParser(inline_comment_prefixes = ('#',))
+    # the Spark settings are case sensitive
+    config.optionxform = str
+    config.read(path)
+
+    for key in ['AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY']:
+        value = config.get('AWS', key, fallback = '').strip("'\"")
+        if value:
+            os.environ[key] = value
+
+    section = config[profile]
+    settings = {key: value for key, value in section.items() if key.startswith('spark.')}
+
+    return section['INPUT_DATA'], section['OUTPUT_DATA'], settings
+
+
+def create_spark_session(config = None):
+    """This functions simply creates a spark session 
+    with the settings of a profile of dl.cfg (e.g. the hadoop
+    extention for reading data from the S3 on the cluster).
+
+    Args:
+        config: dict with Spark settings for the builder, e.g. from load_profile() and join_strategy.join_config().
+
+    Returns:
+        spark: an object containing a SparkSession. 
+    """
+    builder = SparkSession.builder.appName('sparkify_etl')
+    for key, value in (config or {}).items():
+        builder = builder.config(key, value)
+
+    spark = builder.getOrCreate()
+    return spark
+
+
+def print_config(spark, profile, input_data, output_data):
+    """Function to print the profile, the paths and the effective Spark settings, hiding the secrets."""
+    print('profile: {}, input: {}, output: {}'.format(profile, input_data, output_data))
+    for key, value in sorted(spark.sparkContext.getConf().getAll()):
+        if 'secret' in key.lower() or 'password' in key.lower():
+            value = '***'
+        print('  {} = {}'.format(key, value))
+
+
+def process_song_data(spark, input_data, output_data, output_format = 'parquet', compression = None,
+                      song_df = None, incremental = False, metrics = None):
+    """Function to read raw data, about the songs, in json format from S3 putting
+    the data in the right format (indicated schema).
+    Then, from this first table, the dimensions tables songs_table
+    and artists_table are created and saved back into the specified 
+    folder or S3 bucket.
+
+    Args:
+        spark: SparkSession to handle data using Spark;
+        input_data: general path where the data resides, locally or on S3;
+        output_data: folder or bucket where the new tables will be stored;
+        output_format: format of the tables, parquet, csv or orc;
+        compression: codec of the files, None for the default of the format (snappy for parquet and orc);
+        song_df: songs from song_source.load_song_data() shared by the job, None to read them here;
+        incremental: merge the artists into artists_table, the latest record of each one replacing the old;
+        metrics: JobMetrics measuring the writes of each table, None to not measure them.
+    """
+
+    # read song data file, unless the job already read it
+    df = song_df if song_df is not None else read_song_data(spark, input_data)
+
+    # extract columns to create songs table
+    columns_songs = ['song_id',
+                     'title',
+                     'artist_id',
+                     'year',
+                     'duration']
+
+    # create songs_table and drop duplicated rows 
+    songs_table = df.selectExpr(columns_songs).dropDuplicates()
+    
+    # write songs table to parquet files partitioned by year and artist
+    with track_table(metrics, 'songs_table', songs_table, output_data):
+        write_table(songs_table, output_data, 'songs_table', output_format, compression)
+
+
+    # extract columns to create artists table
+    columns_artists = ['artist_id',
+                       'artist_name as name',
+                       'artist_location as location',
+                       'artist_latitude as latitude',
+                       'artist_longitude as longitude']
+
+    # create artists_table and drop duplicated rows 
+    artists_table = df.selectExpr(columns_artists).dropDuplicates()
+    if incremental:
+        # the song year says nothing about the artist record and is often 0, so the latest
+        # record is the one of the last source file (the last compacted batch), the other
+        # columns breaking the ties so every run keeps the same one
+        artists_table = latest_rows(df, 'artist_id', ['source_file', 'year', 'artist_name', 'artist_location',
+                                                      'artist_latitude', 'artist_longitude'])
+        artists_table = artists_table.selectExpr(columns_artists)
+    
+    # write artists table to parquet files
+    with track_table(metrics, 'artists_table', artists_table, output_data):
+        save_table(spark, artists_table, output_data, 'artists_table', output_format, compression, incremental)
+
+
+def process_log_data(spark, input_data, output_data, output_format = 'parquet', compression = None,
+                     song_df = None, join_strategy = 'auto', salt_buckets = 8, id_strategy = 'hash',
+                     incremental = False, log_files = None, metrics = None, time_method = 'columns',
+                     holiday_country = None):
+    """Function to read raw data, about logs and songs, in json format from S3 putting
+    the data in the right format (indicated schema).
+    Then, from this first table, the dimensions tables users_table
+    and time_table as well as the fact table songplays_table are created 
+    and saved back into the specified folder or S3 bucket.
+
+    Args:
+        spark: SparkSession to handle data using Spark;
+        input_data: general path where the data resides, locally or on S3;
+        output_data: folder or bucket where the new tables will be stored;
+        output_format: format of the tables, parquet, csv or orc;
+        compression: codec of the files, None for the default of the format (snappy for parquet and orc);
+        song_df: songs from song_source.load_song_data() shared by the job, None to read them here;
+        join_strategy: strategy of the songplays join, see join_strategy.py;
+        salt_buckets: number of salts of the salted join;
+        id_strategy: how songplay_id is generated, see songplay_ids.py;
+        incremental: merge the users and rewrite only the partitions of time_table and songplays_table
+        with new rows, see incremental_lake.py;
+        log_files: list of the log files to read, None to read all of log_data;
+        metrics: JobMetrics measuring the writes of each table, None to not measure them;
+        time_method: how the attributes of time_table are derived, see time_dimension.py;
+        holiday_country: country of the is_holiday flag of the calendar time method.
+    """
+    
+    # get filepath to log data file
+    log_data = os.path.join(input_data, 'log_data')
+
+    # read log data file
+    df = spark.read.json(log_files or log_data, schema = LOG_SCHEMA)
+
+    # filter by actions for song plays
+    df = df.where(df.page == 'NextSong')
+    # extract columns for users table 
+    columns_users = ['userId as user_id',
+                     'firstName as first_name',
+                     'lastName as last_name',
+                     'gender',
+                     'level']   
+                     
+    # create users_table and drop duplicated rows                      
+    users_table = df.selectExpr(columns_users).dropDuplicates()
+    if incremental:
+        users_table = latest_rows(df, 'userId', 'ts').selectExpr(columns_users)
+    
+    # write users table to parquet files
+    with track_table(metrics, 'users_table', users_table, output_data):
+        save_table(spark, users_table, output_data, 'users_table', output_format, compression, incremental)
+
+    # create timestamp column from original timestamp column
+    df = df.withColumn('start_time', F.to_timestamp(df.ts / 1000))
+
+    # create time table from the distinct timestamps, so the attributes are
+    # derived once per timestamp instead of once per event
+    time_table = build_time_table(df, time_method, holiday_country)
+
+    # write time table to parquet files partitioned by year and month
+    with track_table(metrics, 'time_table', time_table, output_data):
+        save_table(spark, time_table, output_data, 'time_table', output_format, compression, incremental)
+
+
+    # read in song data to use for songplays table, unless the job already read it
+    if song_df is None:
+        song_df = read_song_data(spark, input_data)
+
+    # extract columns from joined song and log datasets to create songplays table
+    columns_songplay = ['start_time', 
+                        'userId as user_id', 
+                        'level', 
+                        'song_id', 
+                        'artist_id',
+                        'sessionId as session_id', 
+                        'location',
+                        'userAgent as user_agent',
+                        'year(start_time) as year',
+                        'month(start_time) as month',
+                        'songplay_id'] 
+
+    # join the songs and create the songplay_id column from the events, in parallel
+    songplays_table = join_songs(df, song_df, join_strategy, salt_buckets)
+    songplays_table, cached = add_songplay_id(songplays_table, id_strategy)
+    songplays_table = songplays_table.selectExpr(columns_songplay)
+
+    # write songplays table to parquet files partitioned by year and month
+    try:
+        with track_table(metrics, 'songplays_table', songplays_table, output_data):
+            save_table(spark, songplays_table, output_data, 'songplays_table', output_format, compression,
+                       incremental)
+    finally:
+        # release the rows the offsets strategy persisted to number them
+        if cached is not None:
+            cached.unpersist()
+
+
+def main():
+    """Function to create a SparkSession a parses it with input and output paths
+    into the functions to process the raw data from the desired path and 
+    save it into the chosen destination.
+
+    --profile chooses the section of dl.cfg with the paths and the Spark settings of the
+    run: local (the sample data on this machine) or cluster (S3 from an EMR cluster).
+    --input-data, --output-data and --conf KEY=VALUE override them, and the effective
+    settings are printed at the start.
+
+    The tables are written as snappy Parquet by default, songs_table partitioned by year
+    and artist_id and time_table and songplays_table by year and month (see table_io.py);
+    --format and --compression choose another format or codec, e.g. --compression zstd.
+
+    The song data is read once and persisted with --song-storage-level for both functions;
+    with --song-staging PATH it is also parsed once into Parquet at PATH, read from there and
+    deleted at the end.
+
+    --join-strategy chooses how the events are joined with the songs (see join_strategy.py):
+    auto broadcasts the songs under --broadcast-threshold-mb and lets AQE split skewed
+    partitions, broadcast and shuffle force a strategy and salted spreads hot songs
+    over --salt-buckets partitions.
+
+    --songplay-ids chooses how songplay_id is generated without a window over all the rows
+    (see songplay_ids.py): a hash of the event, or numbers from per-partition offsets.
+
+    With --compact-songs PATH the song files not compacted yet are first rolled into a new
+    batch of Parquet files at PATH (see compact_songs.py), and the songs are read from there.
+
+    With --load incremental only the log files missing from the checkpoint of the data lake
+    are processed: the users and artists are merged, the latest record of each one replacing
+    the old, the year/month partitions of time_table and songplays_table with new rows are
+    rewritten with the old and new rows, and the checkpoint is updated at the end. A full
+    load also stores the checkpoint of the log files it read.
+
+    With --metrics-report PATH the stages, shuffle and spill bytes and the input and output
+    files of each table are written to PATH (see job_metrics.py), warning about stages run
+    by a single task and tables written as too many small files.
+
+    --time-method calendar derives the attributes of time_table with a pandas UDF over Arrow
+    batches, adding the ISO year, quarter, day of the year and weekend and holiday flags
+    (holidays of --holidays COUNTRY, with the holidays package) to the ones of the default
+    column expressions. Both reduce the events to their distinct ts first.
+    """
+    parser = argparse.ArgumentParser(description = 'Build the Sparkify tables of the data lake.')
+    parser.add_argument('--profile', choices = PROFILES, default = 'local', help = 'section of dl.cfg to run with')
+    parser.add_argument('--config', default = 'dl.cfg', help = 'path of the config file')
+    parser.add_argument('--input-data', help = 'path of the raw data, instead of INPUT_DATA of the profile')
+    parser.add_argument('--output-data', help = 'path of the tables, instead of OUTPUT_DATA of the profile')
+    parser.add_argument('--conf', action = 'append', default = [], metavar = 'KEY=VALUE',
+                        help = 'Spark setting overriding the profile, can be repeated')
+    parser.add_argument('--format', choices = OUTPUT_FORMATS, default = 'parquet', help = 'format of the tables')
+    parser.add_argument('--compression', help = 'codec of the files, e.g. snappy, zstd, gzip or none')
+    parser.add_argument('--song-storage-level', choices = STORAGE_LEVELS, default = 'MEMORY_AND_DISK',
+                        help = 'storage level of the song data shared by the tables, NONE to not persist it')
+    parser.add_argument('--song-staging', metavar = 'PATH', help = 'folder for a columnar copy of the song data')
+    parser.add_argument('--join-strategy', choices = JOIN_STRATEGIES, default = 'auto',
+                        help = 'strategy of the join of the events with the songs')
+    parser.add_argument('--broadcast-threshold-mb', type = int, default = 10,
+                        help = 'size under which the songs are broadcast with --join-strategy auto')
+    parser.add_argument('--salt-buckets', type = int, default = 8, help = 'salts of --join-strategy salted')
+    parser.add_argument('--songplay-ids', choices = ID_STRATEGIES, default = 'hash',
+                        help = 'hash of each event or consecutive numbers from per-partition offsets')
+    parser.add_argument('--compact-songs', metavar = 'PATH', help = 'compact the new song files into PATH and read them from it')
+    parser.add_argument('--compact-target-mb', type = int, default = 128, help = 'megabytes of json in each compacted file')
+    parser.add_argument('--load', choices = ['full', 'incremental'], default = 'full',
+                        help = 'rebuild all the tables or add only the log files not processed yet')
+    parser.add_argument('--metrics-report', metavar = 'PATH', help = 'write the metrics of each table to this json file')
+    parser.add_argument('--time-method', choices = TIME_METHODS, default = 'columns',
+                        help = 'column expressions or a pandas UDF with more calendar attributes for time_table')
+    parser.add_argument('--holidays', metavar = 'COUNTRY', help = 'country of the holidays of --time-method calendar, e.g. US')
+    args = parser.parse_args()
+    if args.load == 'incremental' and args.songplay_ids != 'hash':
+        parser.error('--load incremental needs --songplay-ids hash, the ids of the old songplays must not change')
+
+    input_data, output_data, settings = load_profile(args.profile, args.config)
+    input_data = args.input_data or input_data
+    output_data = args.output_data or output_data
+    settings.update(join_config(args.join_strategy, args.broadcast_threshold_mb))
+    for item in args.conf:
+        key, sep, value = item.partition('=')
+        if not sep or not key:
+            parser.error('--conf expects KEY=VALUE, got {}'.format(item))
+        settings[key] = value
+
+    spark = create_spark_session(settings)
+    print_config(spark, args.profile, input_data, output_data)
+    metrics = JobMetrics(spark) if args.metrics_report else None
+
+    if args.compact_songs:
+        print('compacted songs: {}'.format(compact_song_data(spark, input_data, args.compact_songs,
+                                                             args.compact_target_mb)))
+    song_df = load_song_data(spark, input_data, args.song_storage_level, args.song_staging, args.compact_songs)
+    incremental = args.load == 'incremental'
+    try:
+        process_song_data(spark, input_data, output_data, args.format, args.compression, song_df, incremental,
+                          metrics)
+
+        # the log files are listed first, so the checkpoint has the ones read by this run
+        checkpoint = read_checkpoint(spark, output_data) if incremental else {'log_files': []}
+        log_files = select_new_log_files(spark, input_data, checkpoint)
+        print('log files to process: {}'.format(len(log_files)))
+
+        if log_files:
+            process_log_data(spark, input_data, output_data, args.format, args.compression, song_df,
+                             args.join_strategy, args.salt_buckets, args.songplay_ids, incremental, log_files,
+                             metrics, args.time_method, args.holidays)
+            write_checkpoint(spark, output_data, checkpoint['log_files'] + log_files)
+    finally:
+        release_song_data(spark, song_df, args.song_staging)
+
+        # the report is also written when a table failed, with the tables written until then
+        if metrics is not None:
+            metrics.write_report(args.metrics_report)
+    print('job finished')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import os
+import json
+from datetime import datetime, timezone
+import pyspark.sql.functions as F
+from pyspark.sql.window import Window
+
+from compact_songs import get_file_system, list_json_files
+from song_source import delete_path
+from table_io import PARTITIONS, read_table, write_table
+
+
+# file of the data lake with the log files already processed
+CHECKPOINT_FILE = '_checkpoint/log_data.json'
+
+# folder of the data lake where the merged tables are written before replacing the old ones
+STAGING_FOLDER = '_staging'
+
+# how each table is updated by an incremental run: the dimensions are merged, their new
+# rows replacing the old ones with the same key, and the partitions of the new rows of
+# the other tables are rewritten with the old and new rows, one row per key
+INCREMENTAL_TABLES = {'users_table': ('merge', ['user_id']),
+                      'artists_table': ('merge', ['artist_id']),
+                      'time_table': ('partitions', ['start_time']),
+                      'songplays_table': ('partitions', ['songplay_id'])}
+
+
+def table_exists(spark, output_data, table):
+    """Function to check whether a table was already written to the data lake."""
+    fs, jvm_path = get_file_system(spark, os.path.join(output_data, table))
+
+    return fs.exists(jvm_path)
+
+
+def read_checkpoint(spark, output_data):
+    """Function to read the checkpoint of the data lake, empty before the first incremental run.
+
+    Returns:
+        checkpoint: dict with the list of log_files processed and the time it was updated_at.
+    """
+    path = os.path.join(output_data, CHECKPOINT_FILE)
+    fs, jvm_path = get_file_system(spark, path)
+    if not fs.exists(jvm_path):
+        return {'log_files': [], 'updated_at': None}
+
+    return json.loads('\n'.join(row.value for row in spark.read.text(path).collect()))
+
+
+def write_checkpoint(spark, output_data, log_files):
+    """Function to replace the checkpoint of the data lake with the log files processed so far."""
+    fs, jvm_path = get_file_system(spark, os.path.join(output_data, CHECKPOINT_FILE))
+    checkpoint = {'log_files': sorted(log_files), 'updated_at': datetime.now(timezone.utc).isoformat()}
+
+    stream = fs.create(jvm_path, True)
+    try:
+        stream.write(json.dumps(checkpoint, indent = 2).encode('utf8'))
+    finally:
+        stream.close()
+
+
+def select_new_log_files(spark, input_data, checkpoint):
+    """Function to list the daily log files under input_data/log_data that are not in the checkpoint."""
+    processed = set(checkpoint['log_files'])
+
+    return sorted(path for path, _, _ in list_json_files(spark, os.path.join(input_data, 'log_data'))
+                  if path not in processed)
+
+
+def latest_rows(df, key, order):
+    """Function to keep the row of each key that comes first when sorted by the order
+    column, or list of columns, descending."""
+    order = [order] if isinstance(order, str) else order
+    window = Window.partitionBy(key).orderBy(*[F.col(column).desc() for column in order])
+
+    return df.withColumn('_rank', F.row_number().over(window)).where(F.col('_rank') == 1).drop('_rank')
+
+
+def replace_through_staging(spark, df, output_data, table, output_format, compression, dynamic):
+    """Function to write df to the staging folder as Parquet and then from there over the
+    table, as Spark cannot overwrite the files of a table it is still reading.
+    """
+    staging = os.path.join(output_data, STAGING_FOLDER)
+    write_table(df, staging, table, 'parquet')
+    try:
+        write_table(read_table(spark, staging, table, 'parquet').select(*df.columns), output_data, table,
+                    output_format, compression, dynamic = dynamic)
+    finally:
+        delete_path(spark, os.path.join(staging, table))
+
+
+def save_table(spark, df, output_data, table, output_format = 'parquet', compression = None, incremental = False):
+    """Function to write a table of the ETL. A full run overwrites the table; an incremental
+    run updates it as INCREMENTAL_TABLES says, with the old rows cast to the types of the new
+    ones and the columns they lack (e.g. the calendar columns of the time table) left null.
+    The first incremental run of a table just writes it.
+
+    Args:
+        spark: SparkSession to handle data using Spark;
+        df: DataFrame with the new rows of the table;
+        output_data: folder's path or bucket where the tables are stored;
+        table: name of the table;
+        output_format: parquet, csv or orc;
+        compression: codec of the files, None for the default of the format;
+        incremental: update the table with df instead of replacing it.
+    """
+    if not incremental or table not in INCREMENTAL_TABLES or not table_exists(spark, output_data, table):
+        write_table(df, output_data, table, output_format, compression)
+        return
+
+    how, key = INCREMENTAL_TABLES[table]
+    old = read_table(spark, output_data, table, output_format)
+    old = old.select(*[(F.col(field.name) if field.name in old.columns else F.lit(None))
+                       .cast(field.dataType).alias(field.name) for field in df.schema.fields])
+
+    if how == 'merge':
+        merged = old.join(df.select(*key), on = key, how = 'left_anti').unionByName(df)
+        replace_through_staging(spark, merged, output_data, table, output_format, compression, dynamic = False)
+    else:
+        partitions = PARTITIONS[table]
+        old = old.join(df.select(*partitions).distinct(), on = partitions, how = 'left_semi')
+        merged = old.unionByName(df).dropDuplicates(key)
+        replace_through_staging(spark, merged, output_data, table, output_format, compression, dynamic = True)
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import contextlib
+import urllib.request
+from datetime import datetime, timezone
+
+from compact_songs import get_file_system
+
+
+# format of the times of the REST API of the Spark UI, e.g. 2018-11-01T21:01:46.796GMT
+UI_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f%Z'
+
+# a stage run by a single task is reported when it reads at least this many bytes
+SINGLE_TASK_BYTES = 16 * 1024 * 1024
+
+# a table is reported when it has more than MAX_SMALL_FILES files under SMALL_FILE_BYTES
+SMALL_FILE_BYTES = 32 * 1024 * 1024
+MAX_SMALL_FILES = 20
+
+
+def get_json(url):
+    """Function to read a json document of the REST API of the Spark UI."""
+    with urllib.request.urlopen(url) as response:
+        return json.load(response)
+
+
+def group_stages(spark, job_group):
+    """Function to read the completed stages of the jobs of a job group from the REST API
+    of the Spark UI, which the driver serves in local mode and on the cluster unless
+    spark.ui.enabled is false. Only the stage totals are requested, not every task.
+
+    Returns:
+        stages: list of dicts with the id, name, tasks, seconds, input, shuffle and spill
+        bytes and executor run time of each stage, empty when the UI is disabled.
+    """
+    if spark.sparkContext.uiWebUrl is None:
+        return []
+
+    api = '{}/api/v1/applications/{}'.format(spark.sparkContext.uiWebUrl, spark.sparkContext.applicationId)
+    stage_ids = {stage_id for job in get_json(api + '/jobs') if job.get('jobGroup') == job_group
+                 for stage_id in job['stageIds']}
+
+    stages = []
+    for stage_id in sorted(stage_ids):
+        for attempt in get_json('{}/stages/{}?details=false'.format(api, stage_id)):
+            if attempt['status'] != 'COMPLETE':
+                continue
+            submitted, completed = (datetime.strptime(attempt[key], UI_TIME_FORMAT)
+                                    for key in ['submissionTime', 'completionTime'])
+            stages.append({'stage_id': stage_id, 'name': attempt['name'], 'tasks': attempt['numTasks'],
+                           'seconds': round((completed - submitted).total_seconds(), 3),
+                           'input_bytes': attempt['inputBytes'],
+                           'shuffle_read_bytes': attempt['shuffleReadBytes'],
+                           'shuffle_write_bytes': attempt['shuffleWriteBytes'],
+                           'spill_bytes': attempt['memoryBytesSpilled'] + attempt['diskBytesSpilled'],
+                           'executor_run_s': round(attempt['executorRunTime'] / 1000, 3)})
+
+    return stages
+
+
+def summarize_stages(stages):
+    """Function to add up the stages of group_stages()."""
+    return {'stages': len(stages), 'tasks': sum(stage['tasks'] for stage in stages),
+            'shuffle_read_bytes': sum(stage['shuffle_read_bytes'] for stage in stages),
+            'shuffle_write_bytes': sum(stage['shuffle_write_bytes'] for stage in stages),
+            'spill_bytes': sum(stage['spill_bytes'] for stage in stages),
+            'executor_run_s': round(sum(stage['executor_run_s'] for stage in stages), 3),
+            'stage_s': [stage['seconds'] for stage in stages]}
+
+
+def list_output_files(spark, path):
+    """Function to list the sizes of the data files of a table, without the _SUCCESS and hidden files."""
+    fs, jvm_path = get_file_system(spark, path)
+    if not fs.exists(jvm_path):
+        return []
+
+    sizes = []
+    iterator = fs.listFiles(jvm_path, True)
+    while iterator.hasNext():
+        status = iterator.next()
+        if not status.getPath().getName().startswith(('_', '.')):
+            sizes.append(status.getLen())
+
+    return sizes
+
+
+class JobMetrics:
+    """
+    Stages, shuffle, spill, input and output files of each table written by the job.
+
+    Each table is written inside table(), which runs its Spark jobs in a job group named
+    after it, and collect() reads the stages of each group from the Spark UI once the
+    job is over, together with the files written to the folder of the table.
+    """
+
+    def __init__(self, spark):
+        self.spark = spark
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.tables = []
+
+    @contextlib.contextmanager
+    def table(self, table, df, output_path):
+        """Run the writes of the with block in the job group of table, measuring their wall time."""
+        sc = self.spark.sparkContext
+        sc.setJobGroup(table, 'write {}'.format(table))
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            sc.setLocalProperty('spark.jobGroup.id', None)
+            self.tables.append({'table': table, 'wall_s': round(time.perf_counter() - start, 3),
+                                'input_files': len(df.inputFiles()), 'output_path': output_path})
+
+    def collect(self):
+        """
+        Read the stages and output files of every table and check them.
+
+        Returns:
+            report: dict with the measures of each table and the list of warnings.
+        """
+        tables, warnings = [], []
+        if self.spark.sparkContext.uiWebUrl is None:
+            warnings.append('the Spark UI is disabled (spark.ui.enabled), the stages were not measured')
+
+        for entry in self.tables:
+            try:
+                stages = group_stages(self.spark, entry['table'])
+            except OSError as error:
+                stages = []
+                warnings.append('{}: the stages could not be read from the Spark UI: {}'.format(
+                    entry['table'], error))
+            sizes = list_output_files(self.spark, entry['output_path'])
+            small_files = sum(1 for size in sizes if size < SMALL_FILE_BYTES)
+            tables.append(dict(entry, output_files = len(sizes), output_bytes = sum(sizes), small_files = small_files,
+                               stage_details = stages, **summarize_stages(stages)))
+
+            for stage in stages:
+                if stage['tasks'] == 1 and stage['input_bytes'] + stage['shuffle_read_bytes'] >= SINGLE_TASK_BYTES:
+                    warnings.append('{}: stage {} ({}) ran in a single task over {} bytes'.format(
+                        entry['table'], stage['stage_id'], stage['name'],
+                        stage['input_bytes'] + stage['shuffle_read_bytes']))
+            if small_files > MAX_SMALL_FILES:
+                warnings.append('{}: {} of its {} output files are under {} MB'.format(
+                    entry['table'], small_files, len(sizes), SMALL_FILE_BYTES // (1024 * 1024)))
+
+        return {'started_at': self.started_at, 'application_id': self.spark.sparkContext.applicationId,
+                'tables': tables, 'warnings': warnings}
+
+    def write_report(self, path):
+        """Write the report of collect() to a json file and print its warnings."""
+        report = self.collect()
+        with open(path, 'w') as f:
+            json.dump(report, f, indent = 2)
+
+        for warning in report['warnings']:
+            print('WARNING {}'.format(warning))
+        return report
+
+
+def track_table(metrics, table, df, output_data):
+    """Function to measure the writes of a table with metrics, or do nothing when metrics is None."""
+    if metrics is None:
+        return contextlib.nullcontext()
+
+    return metrics.table(table, df, os.path.join(output_data, table))
@@ -0,0 +1,63 @@
+import pyspark.sql.functions as F
+
+
+# auto: the planner broadcasts the songs when they are under the threshold, AQE splits skewed partitions;
+# broadcast: the songs are always broadcast; shuffle: sort-merge join of both sides, AQE splits
+# skewed partitions; salted: the events of each song are spread over salt_buckets partitions
+JOIN_STRATEGIES = ['auto', 'broadcast', 'shuffle', 'salted']
+
+
+def join_config(strategy = 'auto', broadcast_threshold_mb = 10, skew_factor = 5, skew_threshold_mb = 256):
+    """Function to build the Spark settings of the songplays join for a strategy, to be
+    given to create_spark_session().
+
+    Args:
+        strategy: one of JOIN_STRATEGIES;
+        broadcast_threshold_mb: size under which the planner broadcasts a side of a join (auto);
+        skew_factor: times the median size a partition must have to be split by AQE;
+        skew_threshold_mb: size a partition must also have to be split by AQE.
+
+    Returns:
+        config: dict with the Spark settings.
+    """
+    if strategy not in JOIN_STRATEGIES:
+        raise ValueError('unknown join strategy {}, expected one of {}'.format(strategy, JOIN_STRATEGIES))
+
+    threshold = '{}m'.format(broadcast_threshold_mb) if strategy in ['auto', 'broadcast'] else '-1'
+    return {'spark.sql.adaptive.enabled': 'true',
+            'spark.sql.autoBroadcastJoinThreshold': threshold,
+            'spark.sql.adaptive.autoBroadcastJoinThreshold': threshold,
+            # the salted join already spreads the hot songs, AQE would split them again
+            'spark.sql.adaptive.skewJoin.enabled': str(strategy != 'salted').lower(),
+            'spark.sql.adaptive.skewJoin.skewedPartitionFactor': str(skew_factor),
+            'spark.sql.adaptive.skewJoin.skewedPartitionThresholdInBytes': '{}m'.format(skew_threshold_mb)}
+
+
+def join_songs(df, song_df, strategy = 'auto', salt_buckets = 8):
+    """Function to left join the song plays with the songs on title, duration and artist
+    name using a strategy of JOIN_STRATEGIES. For the salted join each event gets a
+    random salt and each song is repeated once per salt, so the events of a hot song are
+    joined by salt_buckets tasks instead of one.
+
+    Args:
+        df: DataFrame of the NextSong events;
+        song_df: DataFrame of the songs;
+        strategy: one of JOIN_STRATEGIES;
+        salt_buckets: number of salts of the salted join.
+
+    Returns:
+        df: DataFrame with the columns of both sides (and a salt column when salted).
+    """
+    if strategy == 'broadcast':
+        song_df = F.broadcast(song_df)
+    elif strategy == 'shuffle':
+        song_df = song_df.hint('merge')
+    elif strategy == 'salted':
+        df = df.withColumn('salt', F.floor(F.rand() * salt_buckets).cast('int'))
+        song_df = song_df.withColumn('salt', F.explode(F.array([F.lit(salt) for salt in range(salt_buckets)])))
+
+    condition = [df.song == song_df.title, df.length == song_df.duration, df.artist == song_df.artist_name]
+    if strategy == 'salted':
+        condition.append(df.salt == song_df.salt)
+
+    return df.join(song_df, on = condition, how = 'left_outer')
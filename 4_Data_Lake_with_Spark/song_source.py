@@ -0,0 +1,85 @@
+import os
+import pyspark.sql.functions as F
+from pyspark import StorageLevel
+from pyspark.sql.types import StructType, StructField, IntegerType,\
+        StringType, FloatType, DoubleType
+
+
+# schema of the song files, shared by the songs and artists tables and the songplays join
+SONG_SCHEMA = StructType([StructField('num_songs', IntegerType()),
+                          StructField('artist_id', StringType()),
+                          StructField('artist_latitude', FloatType()),
+                          StructField('artist_longitude', FloatType()),
+                          StructField('artist_location', StringType()),
+                          StructField('artist_name', StringType()),
+                          StructField('song_id', StringType()),
+                          StructField('title', StringType()),
+                          StructField('duration', DoubleType()),
+                          StructField('year', IntegerType())
+                          ])
+
+STORAGE_LEVELS = ['NONE', 'MEMORY_ONLY', 'MEMORY_AND_DISK', 'MEMORY_AND_DISK_SER', 'DISK_ONLY']
+
+
+def read_song_data(spark, input_data, compacted_path = None):
+    """Function to read all the song json files under input_data/song_data with SONG_SCHEMA,
+    or the Parquet batches of the compacted set written by compact_songs.py. Each song
+    gets the source_file it was read from: the batch=<time of the run> folders of the
+    compacted set sort by the time the songs arrived, the json paths only by name.
+
+    Args:
+        spark: SparkSession to handle data using Spark;
+        input_data: general path where the data resides;
+        compacted_path: folder of the compacted set, None to read the json files.
+
+    Returns:
+        df: DataFrame of the songs, with the source_file column.
+    """
+    if compacted_path:
+        df = spark.read.parquet(compacted_path).select(*SONG_SCHEMA.fieldNames())
+    else:
+        song_data = os.path.join(input_data, 'song_data')
+        df = spark.read.option("recursiveFileLookup", "true").json(song_data, schema = SONG_SCHEMA)
+
+    return df.withColumn('source_file', F.input_file_name())
+
+
+def load_song_data(spark, input_data, storage_level = 'MEMORY_AND_DISK', staging_path = None,
+                   compacted_path = None):
+    """Function to read the song data once for the whole job. With a staging_path the
+    json files are parsed once and written there as Parquet, and the songs are read back
+    from it, so the later scans read a few columnar files instead of listing and parsing
+    every json file again. The DataFrame is then persisted with storage_level.
+
+    Args:
+        spark: SparkSession to handle data using Spark;
+        input_data: general path where the data resides;
+        storage_level: name of the pyspark StorageLevel, NONE to leave it unpersisted;
+        staging_path: folder for the columnar copy of the songs, None to read the json directly;
+        compacted_path: folder of the compacted set to read instead of the json files.
+
+    Returns:
+        df: DataFrame of the songs, to be released with release_song_data().
+    """
+    df = read_song_data(spark, input_data, compacted_path)
+    if staging_path:
+        df.write.parquet(staging_path, mode = 'overwrite')
+        df = spark.read.parquet(staging_path)
+
+    if storage_level != 'NONE':
+        df = df.persist(getattr(StorageLevel, storage_level))
+
+    return df
+
+
+def delete_path(spark, path):
+    """Function to delete a folder of any file system Hadoop can reach (local, HDFS or S3)."""
+    jvm_path = spark._jvm.org.apache.hadoop.fs.Path(path)
+    jvm_path.getFileSystem(spark._jsc.hadoopConfiguration()).delete(jvm_path, True)
+
+
+def release_song_data(spark, df, staging_path = None):
+    """Function to unpersist the songs of load_song_data() and delete their columnar copy."""
+    df.unpersist()
+    if staging_path:
+        delete_path(spark, staging_path)
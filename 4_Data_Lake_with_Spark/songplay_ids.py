@@ -0,0 +1,70 @@
+import pyspark.sql.functions as F
+from pyspark import StorageLevel
+
+
+# hash: 63 bits hash of the event and its song, computed by each task on its own rows;
+# offsets: 1..N numbers in the order of the event key, from the row counts of each partition
+ID_STRATEGIES = ['hash', 'offsets']
+
+# columns of the joined events and songs that identify a songplay in every run
+SONGPLAY_KEY = ['userId', 'sessionId', 'itemInSession', 'ts', 'song_id']
+
+
+def add_hash_id(df, key = SONGPLAY_KEY):
+    """Function to add a songplay_id computed from the key of each row with xxhash64,
+    kept positive. The same event gets the same id in every run, with no shuffle, and
+    the chance of two of 100 million songplays sharing an id is about 1 in 2,000.
+    Identical duplicated events get the same id too, and the incremental load keeps
+    only one of them (dropDuplicates on songplay_id).
+
+    Returns:
+        df, cached: DataFrame with the songplay_id column, and None as nothing is persisted.
+    """
+    return df.withColumn('songplay_id', F.xxhash64(*key).bitwiseAND(F.lit(0x7FFFFFFFFFFFFFFF))), None
+
+
+def add_offset_id(df, key = SONGPLAY_KEY):
+    """Function to number the rows 1..N in the order of key without moving them to a
+    single partition: the rows are range partitioned and sorted by key, the rows of
+    each partition are counted, and each row gets the rows of the partitions before
+    its own plus its position in it. The same input gets the same ids in every run.
+
+    Returns:
+        df, cached: DataFrame with the songplay_id column, and the sorted rows persisted
+        to count them once, to be unpersisted once df is written.
+    """
+    df = df.orderBy(*key).withColumn('_partition', F.spark_partition_id()) \
+        .withColumn('_row_id', F.monotonically_increasing_id()) \
+        .persist(StorageLevel.MEMORY_AND_DISK)
+
+    # monotonically_increasing_id() puts the partition id in the upper 31 bits
+    counts = dict(df.groupBy('_partition').count().collect())
+    offsets, total = [], 0
+    for partition in range(max(counts, default = -1) + 1):
+        offsets.append(total)
+        total += counts.get(partition, 0)
+
+    position = F.col('_row_id') - F.shiftLeft(F.col('_partition').cast('long'), 33)
+    offset = F.element_at(F.array(*[F.lit(value) for value in offsets or [0]]), F.col('_partition') + 1)
+
+    return df.withColumn('songplay_id', (offset + position + 1).cast('long')).drop('_partition', '_row_id'), df
+
+
+def add_songplay_id(df, strategy = 'hash'):
+    """Function to add the songplay_id column to the joined events and songs.
+
+    Args:
+        df: DataFrame of the events joined with the songs, with the columns of SONGPLAY_KEY;
+        strategy: one of ID_STRATEGIES.
+
+    Returns:
+        df: DataFrame with the songplay_id column;
+        cached: DataFrame persisted by the strategy, to be unpersisted once df is written,
+        or None.
+    """
+    if strategy == 'hash':
+        return add_hash_id(df)
+    if strategy == 'offsets':
+        return add_offset_id(df)
+
+    raise ValueError('unknown songplay_id strategy {}, expected one of {}'.format(strategy, ID_STRATEGIES))
@@ -0,0 +1,77 @@
+import os
+import pyspark.sql.functions as F
+
+
+OUTPUT_FORMATS = ['parquet', 'csv', 'orc']
+
+# codec used when none is chosen, csv stays uncompressed as before
+DEFAULT_COMPRESSION = {'parquet': 'snappy', 'orc': 'snappy', 'csv': None}
+
+# columns each table is partitioned by, the tables left out are written in a single folder
+PARTITIONS = {'songs_table': ['year', 'artist_id'],
+              'time_table': ['year', 'month'],
+              'songplays_table': ['year', 'month']}
+
+
+def write_table(df, output_data, table, output_format = 'parquet', compression = None, mode = 'overwrite',
+                dynamic = False):
+    """Function to write a table of the data lake in the chosen format, partitioned
+    by the columns of PARTITIONS. The rows are repartitioned by those columns first,
+    so each partition folder gets one file instead of one per task.
+
+    Args:
+        df: DataFrame with the rows of the table;
+        output_data: folder's path or bucket where the tables are stored;
+        table: name of the table, also the name of its folder;
+        output_format: parquet, csv or orc;
+        compression: codec of the files (e.g. snappy, zstd, gzip), None for the default of the format;
+        mode: save mode of the writer;
+        dynamic: overwrite only the partitions with rows in df, leaving the others as they are.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError('unknown output format {}, expected one of {}'.format(output_format, OUTPUT_FORMATS))
+
+    partitions = PARTITIONS.get(table, [])
+    if partitions:
+        df = df.repartition(*partitions)
+
+    writer = df.write.format(output_format).mode(mode).partitionBy(*partitions)
+    compression = compression or DEFAULT_COMPRESSION[output_format]
+    if compression:
+        writer = writer.option('compression', compression)
+    if output_format == 'csv':
+        writer = writer.option('header', True)
+    if dynamic:
+        writer = writer.option('partitionOverwriteMode', 'dynamic')
+
+    writer.save(os.path.join(output_data, table))
+
+
+def read_table(spark, output_data, table, output_format = 'parquet', **partition_values):
+    """Function to read a table written by write_table(). The values given for its
+    partition columns (e.g. year = 2018, month = 11) are applied as filters on
+    them, so Spark only lists and reads the matching partition folders.
+
+    Args:
+        spark: SparkSession to handle data using Spark;
+        output_data: folder's path or bucket where the tables are stored;
+        table: name of the table;
+        output_format: parquet, csv or orc;
+        partition_values: value of some partition columns of the table.
+
+    Returns:
+        df: DataFrame of the table.
+    """
+    unknown = set(partition_values) - set(PARTITIONS.get(table, []))
+    if unknown:
+        raise ValueError('{} are not partition columns of {}'.format(sorted(unknown), table))
+
+    reader = spark.read.format(output_format)
+    if output_format == 'csv':
+        reader = reader.option('header', True).option('inferSchema', True)
+    df = reader.load(os.path.join(output_data, table))
+
+    for column, value in partition_values.items():
+        df = df.where(F.col(column) == value)
+
+    return df
@@ -0,0 +1,43 @@
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('pyspark')
+pytest.importorskip('pyarrow')
+
+from time_dimension import build_time_table, calendar_frame
+
+
+# 2018-11-01 20:57:10.796 (a Thursday), a null ts and 2019-01-01 00:00:00 (a Tuesday)
+TS = [1541105830796, None, 1546300800000]
+
+
+def test_calendar_frame_keeps_null_timestamps():
+    calendar = calendar_frame(pd.Series(pd.to_datetime(TS, unit = 'ms')))
+
+    assert calendar.iloc[0][['hour', 'week', 'weekday', 'iso_year', 'is_weekend']].tolist() == [20, 44, 5, 2018, False]
+    assert calendar.iloc[1].isna().all()
+    assert calendar.iloc[2][['week', 'iso_year', 'day_of_year']].tolist() == [1, 2019, 1]
+
+
+@pytest.fixture(scope = 'module')
+def spark():
+    from pyspark.sql import SparkSession
+
+    spark = SparkSession.builder.master('local[1]').appName('test_time_dimension').getOrCreate()
+    yield spark
+    spark.stop()
+
+
+def test_calendar_udf_with_null_ts(spark):
+    from pyspark.sql.types import StructType, StructField, LongType
+
+    df = spark.createDataFrame([(ts,) for ts in TS], StructType([StructField('ts', LongType())]))
+    rows = {row.start_time: row for row in build_time_table(df, 'calendar').collect()}
+
+    assert len(rows) == 3
+    assert rows[None].week is None and rows[None].iso_year is None
+    columns = {row.start_time: row for row in build_time_table(df, 'columns').collect()}
+    for start_time, row in rows.items():
+        if start_time is not None:
+            assert (row.hour, row.day, row.week, row.month, row.year, row.weekday) == \
+                tuple(columns[start_time][1:])
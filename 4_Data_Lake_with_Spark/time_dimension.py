@@ -0,0 +1,119 @@
+import pyspark.sql.functions as F
+from pyspark.sql.types import StructType, StructField, IntegerType, BooleanType
+
+
+# columns: the attributes of the time table from Spark column expressions;
+# calendar: the same attributes plus the ISO year, quarter, day of the year, weekend and
+# holiday flags, from a pandas UDF that gets the timestamps in Arrow batches
+TIME_METHODS = ['columns', 'calendar']
+
+CALENDAR_SCHEMA = StructType([StructField('hour', IntegerType()),
+                              StructField('day', IntegerType()),
+                              StructField('week', IntegerType()),
+                              StructField('month', IntegerType()),
+                              StructField('year', IntegerType()),
+                              StructField('weekday', IntegerType()),
+                              StructField('iso_year', IntegerType()),
+                              StructField('quarter', IntegerType()),
+                              StructField('day_of_year', IntegerType()),
+                              StructField('is_weekend', BooleanType()),
+                              StructField('is_holiday', BooleanType())
+                              ])
+
+
+def distinct_start_times(df):
+    """Function to reduce the events to their distinct ts before converting them to timestamps."""
+    return df.select('ts').distinct().select(F.to_timestamp(F.col('ts') / 1000).alias('start_time'))
+
+
+def time_columns(times):
+    """Function to derive the attributes of the time table with Spark column expressions."""
+    return times.select('start_time',
+                        F.hour('start_time').alias('hour'),
+                        F.dayofmonth('start_time').alias('day'),
+                        F.weekofyear('start_time').alias('week'),
+                        F.month('start_time').alias('month'),
+                        F.year('start_time').alias('year'),
+                        F.dayofweek('start_time').alias('weekday'))
+
+
+def calendar_frame(start_time, holiday_country = None):
+    """Function to derive the calendar attributes of a batch of timestamps with pandas,
+    the body of calendar_udf(). A null start_time gets null attributes.
+
+    Args:
+        start_time: pandas Series of timestamps;
+        holiday_country: country code of the holidays package (e.g. US) flagging the
+        holidays, None to leave is_holiday empty.
+
+    Returns:
+        calendar: pandas DataFrame with the columns of CALENDAR_SCHEMA.
+    """
+    import pandas as pd
+
+    iso = start_time.dt.isocalendar()
+    dates = start_time.dt.date
+    is_holiday = pd.Series(None, index = start_time.index, dtype = 'boolean')
+    if holiday_country:
+        import holidays
+
+        # a null ts gives a NaT start_time, whose year is NaN
+        years = sorted(set(start_time.dt.year.dropna().astype(int)))
+        country_holidays = holidays.country_holidays(holiday_country, years = years)
+        is_holiday = dates.isin(set(country_holidays)).astype('boolean').mask(start_time.isna())
+
+    # the nullable Int32 and boolean types keep the nulls of a NaT start_time
+    return pd.DataFrame({'hour': start_time.dt.hour.astype('Int32'),
+                         'day': start_time.dt.day.astype('Int32'),
+                         'week': iso.week.astype('Int32'),
+                         'month': start_time.dt.month.astype('Int32'),
+                         'year': start_time.dt.year.astype('Int32'),
+                         # Spark numbers the weekdays from Sunday = 1, pandas from Monday = 0
+                         'weekday': ((start_time.dt.dayofweek + 1) % 7 + 1).astype('Int32'),
+                         'iso_year': iso.year.astype('Int32'),
+                         'quarter': start_time.dt.quarter.astype('Int32'),
+                         'day_of_year': start_time.dt.dayofyear.astype('Int32'),
+                         'is_weekend': (start_time.dt.dayofweek >= 5).astype('boolean').mask(start_time.isna()),
+                         'is_holiday': is_holiday})
+
+
+def calendar_udf(holiday_country = None):
+    """Function to build the pandas UDF of the calendar attributes of a timestamp.
+
+    Args:
+        holiday_country: country code of the holidays package (e.g. US) flagging the
+        holidays, None to leave is_holiday empty.
+
+    Returns:
+        udf: pandas UDF from a column of timestamps to a struct of CALENDAR_SCHEMA.
+    """
+    import pandas as pd
+
+    @F.pandas_udf(CALENDAR_SCHEMA)
+    def calendar(start_time: pd.Series) -> pd.DataFrame:
+        return calendar_frame(start_time, holiday_country)
+
+    return calendar
+
+
+def build_time_table(df, method = 'columns', holiday_country = None):
+    """Function to build the time table from the events: the events are reduced to their
+    distinct ts first, so the attributes are derived once per timestamp and no
+    dropDuplicates over all of them is needed.
+
+    Args:
+        df: DataFrame of the NextSong events, with the ts column;
+        method: one of TIME_METHODS;
+        holiday_country: country of the holidays of the calendar method.
+
+    Returns:
+        time_table: DataFrame with start_time and its attributes.
+    """
+    times = distinct_start_times(df)
+    if method == 'columns':
+        return time_columns(times)
+    if method == 'calendar':
+        return times.select('start_time', calendar_udf(holiday_country)('start_time').alias('calendar')) \
+            .select('start_time', 'calendar.*')
+
+    raise ValueError('unknown time method {}, expected one of {}'.format(method, TIME_METHODS))
@@ -0,0 +1,182 @@
+import os
+import json
+import random
+import string
+import argparse
+from datetime import datetime, timedelta
+
+
+# share of the events that are songs being played, the rest are other pages of the app
+NEXT_SONG_RATIO = 0.8
+
+# share of the NextSong events whose song exists in the generated song data
+MATCH_RATIO = 0.3
+
+# number of events written in each daily log file
+EVENTS_PER_DAY = 10000
+
+# first day of the generated logs, the same month of the sample data
+START_DATE = datetime(2018, 11, 1)
+
+OTHER_PAGES = ["Home", "Logout", "Settings", "Help", "About", "Upgrade", "Downgrade", "Add to Playlist"]
+USER_AGENTS = ['"Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_4) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/36.0.1985.143 Safari/537.36"',
+               '"Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/36.0.1985.143 Safari/537.36"',
+               'Mozilla/5.0 (compatible; MSIE 10.0; Windows NT 6.2; WOW64; Trident/6.0)']
+LOCATIONS = ["San Francisco-Oakland-Hayward, CA", "Phoenix-Mesa-Scottsdale, AZ", "Chicago-Naperville-Elgin, IL-IN-WI",
+             "Atlanta-Sandy Springs-Roswell, GA", "New York-Newark-Jersey City, NY-NJ-PA", "Lansing-East Lansing, MI"]
+FIRST_NAMES = ["Walter", "Kaylee", "Jacob", "Lily", "Chloe", "Jayden", "Tegan", "Mohammad", "Aleena", "Ryan"]
+LAST_NAMES = ["Frye", "Summers", "Klein", "Koch", "Cuevas", "Bell", "Levine", "Rodriguez", "Kirby", "Smith"]
+
+
+def random_id(rng, prefix, length = 16):
+    """Build an id like the ones of the Million Song Dataset, e.g. SOUPIRU12A6D4FA1E1."""
+    return prefix + "".join(rng.choice(string.ascii_uppercase + string.digits) for _ in range(length))
+
+
+def random_words(rng, words):
+    """Build a title or name with the given number of random words."""
+    return " ".join("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9))).capitalize()
+                    for _ in range(words))
+
+
+def generate_songs(output_dir, num_songs, rng):
+    """
+    Write one json file per song under song_data/X/Y/Z/, with the same keys and
+    format of the sample song files.
+
+    Args:
+        output_dir: folder where song_data is created;
+        num_songs: number of song files;
+        rng: random.Random used for all values.
+
+    Returns:
+        songs: list of tuples (title, artist_name, duration) to be played in the logs.
+    """
+    num_artists = max(1, num_songs // 4)
+    artists = [(random_id(rng, "AR"), random_words(rng, 2), rng.choice(LOCATIONS + [""]),
+                rng.choice([None, round(rng.uniform(-60, 60), 5)]), rng.choice([None, round(rng.uniform(-150, 150), 5)]))
+               for _ in range(num_artists)]
+
+    songs = []
+    for _ in range(num_songs):
+        artist_id, artist_name, location, latitude, longitude = rng.choice(artists)
+        track_id = random_id(rng, "TR")
+        title = random_words(rng, rng.randint(1, 4))
+        duration = round(rng.uniform(60, 600), 5)
+        record = {"num_songs": 1, "artist_id": artist_id, "artist_latitude": latitude,
+                  "artist_longitude": longitude, "artist_location": location, "artist_name": artist_name,
+                  "song_id": random_id(rng, "SO"), "title": title, "duration": duration,
+                  "year": rng.choice([0, rng.randint(1960, 2010)])}
+
+        folder = os.path.join(output_dir, "song_data", track_id[2], track_id[3], track_id[4])
+        os.makedirs(folder, exist_ok = True)
+        with open(os.path.join(folder, track_id + ".json"), "w") as f:
+            json.dump(record, f)
+        songs.append((title, artist_name, duration))
+
+    return songs
+
+
+def generate_logs(output_dir, num_events, songs, rng, events_per_day = EVENTS_PER_DAY):
+    """
+    Write the events in daily files under log_data/YYYY/MM/, with the same keys and
+    format of the sample log files, streaming them so the memory does not depend
+    on num_events.
+
+    Args:
+        output_dir: folder where log_data is created;
+        num_events: total number of events;
+        songs: list returned by generate_songs();
+        rng: random.Random used for all values;
+        events_per_day: number of events of each daily file.
+
+    Returns:
+        counts: dict with the number of log files and of NextSong events written.
+    """
+    num_users = 100 + num_events // 10000
+    users = [(str(user_id), rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), rng.choice("MF"),
+              rng.choice(["free", "paid"]), rng.choice(LOCATIONS), rng.choice(USER_AGENTS),
+              float(rng.randint(1540000000000, 1541000000000)))
+             for user_id in range(1, num_users + 1)]
+
+    num_files, next_song_events, written, day = 0, 0, 0, 0
+    while written < num_events:
+        date = START_DATE + timedelta(days = day)
+        folder = os.path.join(output_dir, "log_data", date.strftime("%Y"), date.strftime("%m"))
+        os.makedirs(folder, exist_ok = True)
+
+        day_events = min(events_per_day, num_events - written)
+        day_start = int((date - datetime(1970, 1, 1)).total_seconds() * 1000)
+        offsets = sorted(rng.randrange(86400000) for _ in range(day_events))
+
+        with open(os.path.join(folder, date.strftime("%Y-%m-%d") + "-events.json"), "w") as f:
+            for item, offset in enumerate(offsets):
+                user_id, first_name, last_name, gender, level, location, user_agent, registration = rng.choice(users)
+                event = {"artist": None, "auth": "Logged In", "firstName": first_name, "gender": gender,
+                         "itemInSession": item % 100, "lastName": last_name, "length": None, "level": level,
+                         "location": location, "method": "GET", "page": rng.choice(OTHER_PAGES),
+                         "registration": registration, "sessionId": day * 1000 + int(user_id) % 1000,
+                         "song": None, "status": 200, "ts": day_start + offset, "userAgent": user_agent,
+                         "userId": user_id}
+                if rng.random() < NEXT_SONG_RATIO:
+                    if songs and rng.random() < MATCH_RATIO:
+                        title, artist_name, duration = rng.choice(songs)
+                    else:
+                        title, artist_name, duration = random_words(rng, 2), random_words(rng, 2), round(rng.uniform(60, 600), 5)
+                    event.update({"artist": artist_name, "song": title, "length": duration,
+                                  "method": "PUT", "page": "NextSong"})
+                    next_song_events += 1
+                f.write(json.dumps(event, separators = (",", ":")) + "\n")
+
+        written += day_events
+        num_files += 1
+        day += 1
+
+    return {"log_files": num_files, "next_song_events": next_song_events}
+
+
+def generate(output_dir, num_events, num_songs = None, seed = 0, events_per_day = EVENTS_PER_DAY):
+    """
+    Generate a song_data and log_data tree in the layout of the sample data and
+    write a dataset.json with its size.
+
+    Args:
+        output_dir: folder of the dataset;
+        num_events: total number of log events;
+        num_songs: number of song files, by default one for every 100 events (10 to 1,000,000);
+        seed: seed of the random generator, the same seed gives the same dataset;
+        events_per_day: number of events of each daily log file.
+
+    Returns:
+        summary: dict written to dataset.json.
+    """
+    if num_songs is None:
+        num_songs = min(max(10, num_events // 100), 1000000)
+
+    rng = random.Random(seed)
+    songs = generate_songs(output_dir, num_songs, rng)
+    counts = generate_logs(output_dir, num_events, songs, rng, events_per_day)
+
+    summary = dict(events = num_events, songs = num_songs, song_files = num_songs, seed = seed, **counts)
+    with open(os.path.join(output_dir, "dataset.json"), "w") as f:
+        json.dump(summary, f, indent = 2)
+
+    return summary
+
+
+def main():
+    """Generate a synthetic dataset from the command line."""
+    parser = argparse.ArgumentParser(description = "Generate synthetic Sparkify song and log data.")
+    parser.add_argument("output_dir", help = "folder where song_data and log_data are created")
+    parser.add_argument("--events", type = float, default = 1e3, help = "number of log events, e.g. 1e6")
+    parser.add_argument("--songs", type = int, help = "number of song files")
+    parser.add_argument("--events-per-day", type = int, default = EVENTS_PER_DAY)
+    parser.add_argument("--seed", type = int, default = 0)
+    args = parser.parse_args()
+
+    summary = generate(args.output_dir, int(args.events), args.songs, args.seed, args.events_per_day)
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime, timezone
+
+from generate_data import generate
+from run_benchmark import SPARK_DIR
+
+sys.path.insert(0, SPARK_DIR)
+
+
+def add_hot_song(df, song_df, hot_share, seed = 0):
+    """Make hot_share of the NextSong events play the same song, to measure the join with a skewed key."""
+    import pyspark.sql.functions as F
+
+    if hot_share <= 0:
+        return df
+
+    hot = song_df.select("title", "artist_name", "duration").first()
+    df = df.withColumn("hot", F.rand(seed) < hot_share)
+    for column, value in [("song", hot.title), ("artist", hot.artist_name), ("length", hot.duration)]:
+        df = df.withColumn(column, F.when(df.hot, F.lit(value)).otherwise(df[column]))
+
+    return df.drop("hot")
+
+
+def benchmark_joins(data_dir, strategies, broadcast_threshold_mb, salt_buckets, hot_share):
+    """
+    Join the NextSong events with the songs once per strategy of join_strategy.py, with
+    both sides cached first so only the join is measured.
+
+    Returns:
+        results: list with the wall time and stage metrics of each strategy.
+    """
+    import etl
+    from job_metrics import group_stages, summarize_stages
+    from join_strategy import join_config, join_songs
+    from song_source import read_song_data
+
+    settings = etl.load_profile("local", os.path.join(SPARK_DIR, "dl.cfg"))[2]
+    settings.update(join_config("auto", broadcast_threshold_mb))
+    spark = etl.create_spark_session(settings)
+    song_df = read_song_data(spark, data_dir).cache()
+    df = spark.read.json(os.path.join(data_dir, "log_data"))
+    df = add_hot_song(df.where(df.page == "NextSong"), song_df, hot_share).cache()
+    events, songs = df.count(), song_df.count()
+
+    results = []
+    for strategy in strategies:
+        for key, value in join_config(strategy, broadcast_threshold_mb).items():
+            spark.conf.set(key, value)
+
+        spark.sparkContext.setJobGroup(strategy, "songplays join with the {} strategy".format(strategy))
+        start = time.perf_counter()
+        join_songs(df, song_df, strategy, salt_buckets).write.format("noop").mode("overwrite").save()
+        wall = time.perf_counter() - start
+
+        result = dict(strategy = strategy, events = events, songs = songs, hot_share = hot_share,
+                      wall_s = round(wall, 3), **summarize_stages(group_stages(spark, strategy)))
+        results.append(result)
+        print(json.dumps(result))
+
+    spark.stop()
+    return results
+
+
+def main():
+    """
+    Generate a dataset (or reuse the one of run_benchmark.py), join its events with its
+    songs with each strategy and write the shuffle bytes and stage times to a json report.
+    """
+    from join_strategy import JOIN_STRATEGIES
+
+    parser = argparse.ArgumentParser(description = "Compare the strategies of the songplays join of the Spark ETL.")
+    parser.add_argument("--events", type = float, default = 1e6, help = "number of log events")
+    parser.add_argument("--strategies", nargs = "+", choices = JOIN_STRATEGIES, default = JOIN_STRATEGIES)
+    parser.add_argument("--broadcast-threshold-mb", type = int, default = 10)
+    parser.add_argument("--salt-buckets", type = int, default = 8)
+    parser.add_argument("--hot-share", type = float, default = 0.2,
+                        help = "share of the NextSong events playing the same song, 0 for no skew")
+    parser.add_argument("--workdir", default = "benchmark_data", help = "folder for the generated datasets")
+    parser.add_argument("--output", default = "join_benchmark_results.json")
+    parser.add_argument("--seed", type = int, default = 0)
+    args = parser.parse_args()
+
+    num_events = int(args.events)
+    data_dir = os.path.abspath(os.path.join(args.workdir, "events_{}".format(num_events)))
+    if not os.path.exists(os.path.join(data_dir, "dataset.json")):
+        os.makedirs(data_dir, exist_ok = True)
+        generate(data_dir, num_events, seed = args.seed)
+
+    report = {"started_at": datetime.now(timezone.utc).isoformat(), "cpus": os.cpu_count(),
+              "results": benchmark_joins(data_dir, args.strategies, args.broadcast_threshold_mb,
+                                         args.salt_buckets, args.hot_share)}
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent = 2)
+    print("Report written to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+from generate_data import generate
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+POSTGRES_DIR = os.path.join(ROOT, "1_Data_Modeling_with_Postgres")
+SPARK_DIR = os.path.join(ROOT, "4_Data_Lake_with_Spark")
+
+# tables of sparkifydb counted after each stage of the Postgres ETL
+POSTGRES_TABLES = ["songs", "artists", "users", "time", "songplays"]
+
+# runs one of the process_* functions of etl.py in its own process, with the local profile of dl.cfg
+SPARK_STAGE = ("import sys, etl; spark = etl.create_spark_session(etl.load_profile('local')[2]); "
+               "getattr(etl, sys.argv[1])(spark, sys.argv[2], sys.argv[3]); spark.stop()")
+
+
+def run_stage(command, cwd):
+    """
+    Run one stage of a pipeline as a separate process and measure it.
+
+    Args:
+        command: list with the program and its arguments;
+        cwd: working directory of the process.
+
+    Returns:
+        measures: dict with the wall time in seconds, the peak resident memory in MB of
+        the process and of the children it waited for (e.g. the JVM of Spark) and
+        the exit code.
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd = cwd, stdout = subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    wall = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+    return {"wall_s": round(wall, 3), "peak_rss_mb": round(peak_rss, 1), "exit_code": os.waitstatus_to_exitcode(status)}
+
+
+def count_postgres_rows(dsn):
+    """Count the rows of each table of sparkifydb."""
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    try:
+        cur = conn.cursor()
+        counts = {}
+        for table in POSTGRES_TABLES:
+            cur.execute("SELECT COUNT(*) FROM {};".format(table))
+            counts[table] = cur.fetchone()[0]
+        return counts
+    finally:
+        conn.close()
+
+
+def benchmark_postgres(data_dir, mode, dsn, extra_args):
+    """
+    Recreate sparkifydb and load the dataset with etl.py, one stage at a time.
+
+    Args:
+        data_dir: folder of the generated dataset;
+        mode: --mode of etl.py (row, bulk or parallel);
+        dsn: connection string of sparkifydb, used to count the rows loaded;
+        extra_args: list of other arguments for etl.py.
+
+    Returns:
+        results: list with one dict per stage.
+    """
+    results = []
+    stage = run_stage([sys.executable, "create_tables.py"], POSTGRES_DIR)
+    results.append(dict(stage = "create_tables", rows = 0, **stage))
+
+    snapshot = os.path.join(data_dir, "song_index.pkl")
+    counts = dict.fromkeys(POSTGRES_TABLES, 0)
+    for dataset in ["song_data", "log_data"]:
+        command = [sys.executable, "etl.py", "--mode", mode, "--data-dir", data_dir, "--datasets", dataset,
+                   "--song-index-snapshot", snapshot, "--rebuild-index"] + extra_args
+        stage = run_stage(command, POSTGRES_DIR)
+
+        new_counts = count_postgres_rows(dsn) if stage["exit_code"] == 0 else counts
+        table_rows = {table: new_counts[table] - counts[table] for table in POSTGRES_TABLES}
+        counts = new_counts
+
+        rows = sum(table_rows.values())
+        results.append(dict(stage = dataset, rows = rows, table_rows = table_rows,
+                            rows_per_s = round(rows / stage["wall_s"], 1), **stage))
+
+    return results
+
+
+def benchmark_spark(data_dir, summary):
+    """
+    Run process_song_data and process_log_data of etl.py on the dataset
+    with Spark in local mode.
+
+    Args:
+        data_dir: folder of the generated dataset;
+        summary: content of its dataset.json, the rows of each stage are its input rows.
+
+    Returns:
+        results: list with one dict per stage.
+    """
+    output_dir = os.path.join(data_dir, "spark_output")
+    input_rows = {"process_song_data": summary["songs"], "process_log_data": summary["events"]}
+
+    results = []
+    for function in ["process_song_data", "process_log_data"]:
+        stage = run_stage([sys.executable, "-c", SPARK_STAGE, function, data_dir, output_dir], SPARK_DIR)
+        rows = input_rows[function]
+        results.append(dict(stage = function, rows = rows, rows_per_s = round(rows / stage["wall_s"], 1), **stage))
+
+    return results
+
+
+def add_results(report, pipeline, mode, num_events, results):
+    """Label the results of one pipeline run, add them to the report and print them as json lines."""
+    for result in results:
+        result = dict(pipeline = pipeline, mode = mode, events = num_events, **result)
+        report["results"].append(result)
+        print(json.dumps(result))
+
+
+def main():
+    """
+    Generate a dataset for each scale, run the chosen pipelines on it and write
+    the measures of every stage to a json report.
+    """
+    parser = argparse.ArgumentParser(description = "Benchmark the Sparkify ETL pipelines on synthetic data.")
+    parser.add_argument("--scales", type = float, nargs = "+", default = [1e3, 1e4, 1e5],
+                        help = "numbers of log events, from 1e3 up to 1e8")
+    parser.add_argument("--pipelines", nargs = "+", choices = ["postgres", "spark"], default = ["postgres", "spark"])
+    parser.add_argument("--postgres-modes", nargs = "+", choices = ["row", "bulk", "parallel"], default = ["bulk"])
+    parser.add_argument("--postgres-args", nargs = argparse.REMAINDER, default = [],
+                        help = "other arguments passed to etl.py, must be the last option")
+    parser.add_argument("--dsn", default = "host=127.0.0.1 dbname=sparkifydb user=student password=student")
+    parser.add_argument("--workdir", default = "benchmark_data", help = "folder for the generated datasets")
+    parser.add_argument("--output", default = "benchmark_results.json")
+    parser.add_argument("--seed", type = int, default = 0)
+    args = parser.parse_args()
+
+    report = {"started_at": datetime.now(timezone.utc).isoformat(), "host": platform.node(),
+              "python": platform.python_version(), "cpus": os.cpu_count(), "results": []}
+
+    for scale in args.scales:
+        num_events = int(scale)
+        data_dir = os.path.abspath(os.path.join(args.workdir, "events_{}".format(num_events)))
+
+        # the datasets are kept, so the next runs measure the pipelines only
+        summary_path = os.path.join(data_dir, "dataset.json")
+        if os.path.exists(summary_path):
+            with open(summary_path) as f:
+                summary = json.load(f)
+        else:
+            os.makedirs(data_dir, exist_ok = True)
+            summary = generate(data_dir, num_events, seed = args.seed)
+
+        if "postgres" in args.pipelines:
+            for mode in args.postgres_modes:
+                results = benchmark_postgres(data_dir, mode, args.dsn, args.postgres_args)
+                add_results(report, "postgres", mode, num_events, results)
+        if "spark" in args.pipelines:
+            add_results(report, "spark", "local", num_events, benchmark_spark(data_dir, summary))
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent = 2)
+    print("Report written to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
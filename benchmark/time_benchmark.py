@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime, timezone
+
+from generate_data import generate
+from run_benchmark import SPARK_DIR
+
+sys.path.insert(0, SPARK_DIR)
+
+# events: the attributes derived for every event and dropDuplicates over all of them, as
+# the time table was built before; the others are the methods of time_dimension.py
+METHODS = ["events", "columns", "calendar"]
+
+
+def time_per_event(df):
+    """Build the time table deriving the attributes of every event and dropping the duplicated rows after."""
+    import pyspark.sql.functions as F
+
+    df = df.withColumn("start_time", F.to_timestamp(df.ts / 1000))
+    return df.select("start_time",
+                     F.hour("start_time").alias("hour"),
+                     F.dayofmonth("start_time").alias("day"),
+                     F.weekofyear("start_time").alias("week"),
+                     F.month("start_time").alias("month"),
+                     F.year("start_time").alias("year"),
+                     F.dayofweek("start_time").alias("weekday")).dropDuplicates()
+
+
+def benchmark_time(data_dir, methods, holiday_country):
+    """
+    Build the time table of the NextSong events once per method, with the events cached
+    first so only the time table is measured.
+
+    Returns:
+        results: list with the wall time, rows and stage metrics of each method.
+    """
+    import etl
+    from job_metrics import group_stages, summarize_stages
+    from time_dimension import build_time_table
+
+    spark = etl.create_spark_session(etl.load_profile("local", os.path.join(SPARK_DIR, "dl.cfg"))[2])
+    df = spark.read.json(os.path.join(data_dir, "log_data"), schema = etl.LOG_SCHEMA)
+    df = df.where(df.page == "NextSong").cache()
+    events = df.count()
+
+    results = []
+    for method in methods:
+        time_table = time_per_event(df) if method == "events" else build_time_table(df, method, holiday_country)
+
+        # a noop write computes every column, a count would prune the attributes and the UDF
+        spark.sparkContext.setJobGroup(method, "time table with the {} method".format(method))
+        start = time.perf_counter()
+        time_table.write.format("noop").mode("overwrite").save()
+        wall = time.perf_counter() - start
+        spark.sparkContext.setLocalProperty("spark.jobGroup.id", None)
+        rows = time_table.count()
+
+        result = dict(method = method, events = events, rows = rows, wall_s = round(wall, 3),
+                      events_per_s = round(events / wall, 1), **summarize_stages(group_stages(spark, method)))
+        results.append(result)
+        print(json.dumps(result))
+
+    spark.stop()
+    return results
+
+
+def main():
+    """
+    Generate a dataset (or reuse the one of run_benchmark.py), build its time table with
+    each method and write the wall and stage times to a json report.
+    """
+    parser = argparse.ArgumentParser(description = "Compare the ways of building the time table of the Spark ETL.")
+    parser.add_argument("--events", type = float, default = 1e7, help = "number of log events")
+    parser.add_argument("--methods", nargs = "+", choices = METHODS, default = METHODS)
+    parser.add_argument("--holidays", metavar = "COUNTRY", help = "country of the holidays of the calendar method")
+    parser.add_argument("--workdir", default = "benchmark_data", help = "folder for the generated datasets")
+    parser.add_argument("--output", default = "time_benchmark_results.json")
+    parser.add_argument("--seed", type = int, default = 0)
+    args = parser.parse_args()
+
+    num_events = int(args.events)
+    data_dir = os.path.abspath(os.path.join(args.workdir, "events_{}".format(num_events)))
+    if not os.path.exists(os.path.join(data_dir, "dataset.json")):
+        os.makedirs(data_dir, exist_ok = True)
+        generate(data_dir, num_events, seed = args.seed)
+
+    report = {"started_at": datetime.now(timezone.utc).isoformat(), "cpus": os.cpu_count(),
+              "results": benchmark_time(data_dir, args.methods, args.holidays)}
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent = 2)
+    print("Report written to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()